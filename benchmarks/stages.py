@@ -0,0 +1,146 @@
+import platform
+import time
+
+import lxml.etree as ET
+
+from maat.converter import content_training_text
+from maat.document import read_file, read_header
+from maat.pipeline import Pipeline, filtered_blocks, to_json
+
+STAGES = ["parse", "filter", "convert", "training_text", "test_cases", "serialize"]
+
+# Bump when the shape of the results changes
+RESULTS_VERSION = 1
+
+
+class StageTimer:
+    """
+    Seconds spent in each stage, summed over the blocks of a corpus
+    """
+
+    def __init__(self):
+        self.seconds = dict.fromkeys(STAGES, 0.0)
+        self.started = None
+
+    def start(self):
+        self.started = time.perf_counter()
+
+    def stop(self, stage):
+        now = time.perf_counter()
+        self.seconds[stage] += now - self.started
+        self.started = now
+
+
+def time_corpus(file_paths, pipeline):
+    """
+    Convert `file_paths` the way `Pipeline.process` does, timing each stage.
+    Return (documents, blocks, seconds by stage).
+    """
+    timer = StageTimer()
+    converter = pipeline.converter
+    blocks = 0
+    for file_path in file_paths:
+        timer.start()
+        doc = read_file(file_path)
+        timer.stop("parse")
+        # reading the header counts towards filtering
+        corpus_id, file_id, title, material = pipeline.metadata(
+            file_path, read_header(doc)
+        )
+        metadata = {
+            "corpus_id": corpus_id,
+            "file_id": file_id,
+            "title": title,
+            "material": material,
+        }
+        kept = filtered_blocks(doc, pipeline.detector)
+        timer.stop("filter")
+        for ab_index, (ab, lang) in enumerate(kept):
+            converter.reset()
+            content = converter.content(ab)
+            timer.stop("convert")
+            training_text = content_training_text(content)
+            timer.stop("training_text")
+            record = dict(metadata)
+            record["block_index"] = ab_index + 1
+            record["id"] = f"{record['corpus_id']}/{record['file_id']}/{ab_index + 1}"
+            record["language"] = lang
+            record["training_text"] = training_text
+            pipeline.add_test_cases(record)
+            timer.stop("test_cases")
+            to_json(record)
+            timer.stop("serialize")
+            blocks += 1
+    return len(file_paths), blocks, timer.seconds
+
+
+def rates(documents, blocks, seconds):
+    return {
+        "seconds": seconds,
+        "docs_per_sec": documents / seconds if seconds else None,
+        "blocks_per_sec": blocks / seconds if seconds else None,
+    }
+
+
+def benchmark(corpora, repeat=3, **options):
+    """
+    Time each stage over each of `corpora`, a dict of name -> file paths,
+    keeping the fastest of `repeat` runs. `options` are passed on to the
+    `Pipeline`. Return the results as a JSON-serializable dict.
+    """
+    pipeline = Pipeline(**options)
+    results = {
+        "version": RESULTS_VERSION,
+        "python": platform.python_version(),
+        "lxml": ET.__version__,
+        "options": {
+            "engine": pipeline.converter.engine,
+            "test_cases": pipeline.test_cases,
+        },
+        "repeat": repeat,
+        "corpora": {},
+    }
+    for name, file_paths in corpora.items():
+        best = None
+        for _ in range(repeat):
+            # every run guesses languages afresh
+            pipeline.detector.memo.clear()
+            documents, blocks, seconds = time_corpus(file_paths, pipeline)
+            if best is None:
+                best = seconds
+            else:
+                best = {stage: min(best[stage], seconds[stage]) for stage in STAGES}
+        results["corpora"][name] = {
+            "documents": documents,
+            "blocks": blocks,
+            "stages": {
+                stage: rates(documents, blocks, best[stage]) for stage in STAGES
+            },
+            "total": rates(documents, blocks, sum(best.values())),
+        }
+    return results
+
+
+def regressions(results, baseline, threshold=0.1):
+    """
+    The stages that got slower than in `baseline` by more than `threshold`
+    (a fraction), as (corpus, stage, baseline seconds per block, seconds per
+    block) tuples.
+    Corpora and stages missing from either are skipped.
+    """
+    slower = []
+    for name, corpus in results["corpora"].items():
+        before = baseline["corpora"].get(name)
+        if before is None:
+            continue
+        timings = dict(corpus["stages"], total=corpus["total"])
+        before_timings = dict(before["stages"], total=before["total"])
+        for stage, timing in timings.items():
+            if stage not in before_timings:
+                continue
+            # compare time per block, in case the corpus changed size
+            now = timing["seconds"] / max(corpus["blocks"], 1)
+            then = before_timings[stage]["seconds"] / max(before["blocks"], 1)
+            if then and now > then * (1 + threshold):
+                slower.append((name, stage, then, now))
+    return slower
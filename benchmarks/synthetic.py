@@ -0,0 +1,114 @@
+import os
+import random
+from xml.sax.saxutils import escape
+
+GREEK = "αβγδεζηθικλμνξοπρστυφχψω"
+LATIN = "abcdefghilmnopqrstuvx"
+
+DOCUMENT = """<?xml version="1.0" encoding="UTF-8"?>
+<TEI xmlns="http://www.tei-c.org/ns/1.0">
+<teiHeader><fileDesc>
+<titleStmt><title>Synthetic document {number}</title></titleStmt>
+<publicationStmt><idno type="filename">synthetic.{number}</idno></publicationStmt>
+<sourceDesc><msDesc><physDesc><objectDesc><supportDesc><support>
+<material>papyrus</material>
+</support></supportDesc></objectDesc></physDesc></msDesc></sourceDesc>
+</fileDesc></teiHeader>
+<text><body>
+<div type="translation"><ab>A translation, which is not converted.</ab></div>
+<div type="edition" xml:lang="{lang}">
+{blocks}
+</div>
+</body></text>
+</TEI>
+"""
+
+
+class SyntheticCorpus:
+    """
+    Generate EpiDoc documents shaped like DDbDP editions.
+
+    Each document has `blocks` edition `ab`s of about `block_words` words.
+    `density` is the chance that a word is marked up, with `supplied`,
+    `gap`, `app`, `choice` or `hi`, rather than plain text; marked up words
+    nest up to `depth` elements deep. `untagged` is the share of documents
+    without an `xml:lang`, whose language has to be guessed.
+    Documents depend only on `seed` and their number.
+    """
+
+    def __init__(
+        self,
+        blocks=3,
+        block_words=200,
+        depth=3,
+        density=0.2,
+        untagged=0.0,
+        seed=0,
+    ):
+        self.blocks = blocks
+        self.block_words = block_words
+        self.depth = depth
+        self.density = density
+        self.untagged = untagged
+        self.seed = seed
+
+    def word(self, rng, alphabet):
+        return "".join(rng.choice(alphabet) for _ in range(rng.randint(2, 9)))
+
+    def markup(self, rng, alphabet, depth):
+        if depth <= 0 or rng.random() >= self.density:
+            return escape(self.word(rng, alphabet))
+        inner = self.markup(rng, alphabet, depth - 1)
+        kind = rng.choice(["supplied", "gap", "app", "choice", "hi"])
+        if kind == "supplied":
+            reason = rng.choice(["lost", "lost", "illegible", "omitted"])
+            return f'<supplied reason="{reason}">{inner}</supplied>'
+        if kind == "gap":
+            if rng.random() < 0.2:
+                return '<gap reason="lost" extent="unknown" unit="line"/>'
+            return (
+                f'<gap reason="lost" quantity="{rng.randint(1, 12)}" unit="character"/>'
+            )
+        if kind == "app":
+            other = self.markup(rng, alphabet, depth - 1)
+            return f'<app type="alternative"><lem>{inner}</lem><rdg>{other}</rdg></app>'
+        if kind == "choice":
+            other = self.markup(rng, alphabet, depth - 1)
+            return f"<choice><reg>{other}</reg><orig>{inner}</orig></choice>"
+        return f'<hi rend="supraline">{inner}</hi>'
+
+    def block(self, rng, alphabet):
+        parts = []
+        for i in range(self.block_words):
+            if i and i % 12 == 0:
+                parts.append(f'\n<lb n="{i // 12 + 1}"/>')
+            parts.append(self.markup(rng, alphabet, self.depth))
+        return "<ab>" + " ".join(parts) + "</ab>"
+
+    def document(self, number):
+        """
+        The XML text of document `number`
+        """
+        rng = random.Random(f"{self.seed}/{number}")
+        if rng.random() < 0.5:
+            lang, alphabet = "grc", GREEK
+        else:
+            lang, alphabet = "la", LATIN
+        blocks = "\n".join(self.block(rng, alphabet) for _ in range(self.blocks))
+        text = DOCUMENT.format(number=number, lang=lang, blocks=blocks)
+        if rng.random() < self.untagged:
+            text = text.replace(f' xml:lang="{lang}"', "")
+        return text
+
+    def write(self, directory, documents):
+        """
+        Write `documents` documents into `directory`, returning their paths
+        """
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        for number in range(documents):
+            path = os.path.join(directory, f"synthetic.{number}.xml")
+            with open(path, "w", encoding="utf-8") as file:
+                file.write(self.document(number))
+            paths.append(path)
+        return paths
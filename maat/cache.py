@@ -0,0 +1,202 @@
+import builtins
+import hashlib
+import json
+import sqlite3
+import time
+
+import lxml.etree as ET
+
+from maat.converter import CONVERTER_VERSION, in_supplied_element
+
+
+def cached_error(type_name, message):
+    """
+    An exception like the one a cached conversion recorded: of the builtin
+    type of that name if there is one, otherwise of a stand-in of that name
+    """
+    error_type = getattr(builtins, type_name, None)
+    if not (isinstance(error_type, type) and issubclass(error_type, Exception)):
+        error_type = type(type_name, (Exception,), {})
+    return error_type(message)
+
+
+class BlockCache:
+    """
+    An on-disk cache of block conversions.
+
+    The training text of an `ab`, and the converter errors met making it,
+    are stored under a hash of the block's canonical XML, of whether it is
+    inside a `supplied` element (the one thing outside the block the
+    conversion depends on), and of `CONVERTER_VERSION`. A block converted
+    before, in an earlier run or in another corpus, is not converted again.
+
+    The table lives in an SQLite file, which worker processes can share.
+    New entries are written `batch_size` at a time (and on `flush`); once
+    the entries take more than `max_bytes`, the least recently used ones
+    are evicted down to 90% of it. Hits, misses, writes and evictions are
+    counted in `stats`; the counts of worker processes are combined with
+    `merge`.
+
+    Caches can be pickled (the connection is not), so one can be handed to
+    worker processes, which open their own connection.
+    """
+
+    def __init__(self, path, max_bytes=1 << 30, batch_size=1000):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.batch_size = batch_size
+        self._connection = None
+        self.pending = {}
+        self.used = set()
+        self.stats = self.new_stats()
+
+    def __getstate__(self):
+        return {
+            "path": self.path,
+            "max_bytes": self.max_bytes,
+            "batch_size": self.batch_size,
+        }
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    @staticmethod
+    def new_stats():
+        return {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, timeout=60)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            with self._connection:
+                self._connection.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS blocks (
+                        key BLOB PRIMARY KEY,
+                        training_text TEXT NOT NULL,
+                        errors TEXT,
+                        size INTEGER NOT NULL,
+                        used INTEGER NOT NULL
+                    )
+                    """
+                )
+                self._connection.execute(
+                    "CREATE INDEX IF NOT EXISTS blocks_used ON blocks (used)"
+                )
+                # the total size of the entries, kept up to date with them
+                self._connection.execute(
+                    "CREATE TABLE IF NOT EXISTS size (total INTEGER NOT NULL)"
+                )
+                size = self._connection.execute("SELECT total FROM size")
+                if size.fetchone() is None:
+                    self._connection.execute("INSERT INTO size VALUES (0)")
+        return self._connection
+
+    def close(self):
+        if self._connection is not None:
+            self.flush()
+            self._connection.close()
+            self._connection = None
+
+    def key(self, ab):
+        digest = hashlib.sha256()
+        digest.update(f"{CONVERTER_VERSION}\0".encode())
+        digest.update(b"1\0" if in_supplied_element(ab.getparent()) else b"0\0")
+        digest.update(ET.tostring(ab, method="c14n", exclusive=True))
+        return digest.digest()
+
+    def get(self, key):
+        """
+        The `(training_text, errors)` cached under `key`, where `errors` is a
+        list of `(error, tag)` pairs, or None
+        """
+        entry = self.pending.get(key)
+        if entry is None:
+            entry = self.connection.execute(
+                "SELECT training_text, errors FROM blocks WHERE key = ?", (key,)
+            ).fetchone()
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        self.used.add(key)
+        training_text, errors = entry
+        if not errors:
+            return training_text, []
+        return training_text, [
+            (cached_error(type_name, message), tag)
+            for type_name, message, tag in json.loads(errors)
+        ]
+
+    def put(self, key, training_text, errors=()):
+        """
+        Cache the training text of a block, and the `(error, tag)` pairs
+        met converting it
+        """
+        errors = [(type(error).__name__, str(error), tag) for error, tag in errors]
+        self.pending[key] = (training_text, json.dumps(errors) if errors else None)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the pending entries and when entries were last used, and evict
+        the least recently used entries if the cache is too big
+        """
+        if not self.pending and not self.used:
+            return
+        connection = self.connection
+        now = time.time_ns()
+        with connection:
+            added = 0
+            for key, (training_text, errors) in self.pending.items():
+                size = len(key) + len(training_text.encode()) + len(errors or "")
+                cursor = connection.execute(
+                    "INSERT OR IGNORE INTO blocks VALUES (?, ?, ?, ?, ?)",
+                    (key, training_text, errors, size, now),
+                )
+                if cursor.rowcount:
+                    added += size
+                    self.stats["writes"] += 1
+            connection.executemany(
+                "UPDATE blocks SET used = ? WHERE key = ?",
+                [(now, key) for key in self.used if key not in self.pending],
+            )
+            connection.execute("UPDATE size SET total = total + ?", (added,))
+            self.evict()
+        self.pending = {}
+        self.used = set()
+
+    def evict(self):
+        (total,) = self.connection.execute("SELECT total FROM size").fetchone()
+        if total <= self.max_bytes:
+            return
+        target = total - self.max_bytes * 9 // 10
+        freed = 0
+        keys = []
+        for key, size in self.connection.execute(
+            "SELECT key, size FROM blocks ORDER BY used"
+        ):
+            keys.append((key,))
+            freed += size
+            if freed >= target:
+                break
+        self.connection.executemany("DELETE FROM blocks WHERE key = ?", keys)
+        self.connection.execute("UPDATE size SET total = total - ?", (freed,))
+        self.stats["evictions"] += len(keys)
+
+    def take(self):
+        """
+        Return the stats so far and start counting afresh
+        """
+        stats = self.stats
+        self.stats = self.new_stats()
+        return stats
+
+    def merge(self, stats):
+        """
+        Add the `stats` of another process's cache to these
+        """
+        for name, count in stats.items():
+            self.stats[name] += count
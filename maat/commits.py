@@ -0,0 +1,102 @@
+import json
+import os
+
+
+def commit_log_path(path):
+    """
+    Where the commit log of an output file is kept by default: next to it
+    """
+    return path + ".commits"
+
+
+class CommitLog:
+    """
+    The input files whose records have been safely written to an output
+    file, and how much of the output they take.
+
+    Each commit is a JSON line listing some input files and the size the
+    output had once their records were written and synced to disk. A
+    commit is only logged after that, and is itself synced, so whatever
+    the output holds beyond the last logged size belongs to files that
+    were not committed. A line cut short by a crash is ignored, and cut
+    off when the log is opened.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.files = set()
+        self.offset = 0
+        self.commits = 0
+        valid = 0
+        if os.path.exists(path):
+            with open(path, "rb") as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break
+                    if not line.endswith(b"\n"):
+                        break
+                    self.files.update(entry["files"])
+                    self.offset = entry["offset"]
+                    self.commits += 1
+                    valid += len(line)
+        mode = "r+b" if os.path.exists(path) else "wb"
+        self.file = open(path, mode)
+        self.file.truncate(valid)
+        self.file.seek(valid)
+
+    def restore(self, output_path):
+        """
+        Cut the output at `output_path` back to the last commit, and say
+        whether there was one to continue from (otherwise the output is to
+        be written afresh)
+        """
+        if not self.commits:
+            return False
+        size = os.path.getsize(output_path) if os.path.exists(output_path) else -1
+        if size < self.offset:
+            raise ValueError(
+                f"{output_path} is shorter than {self.path} says it was committed "
+                f"at; it cannot be resumed"
+            )
+        os.truncate(output_path, self.offset)
+        return True
+
+    def commit(self, file_paths, offset):
+        line = json.dumps({"files": list(file_paths), "offset": offset})
+        self.file.write(line.encode("utf-8") + b"\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.files.update(file_paths)
+        self.offset = offset
+        self.commits += 1
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def write_committed(batches, sink, log, every=100):
+    """
+    Write the records of `(file_path, records)` batches to a `JSONLSink`,
+    committing them to `log` every `every` files. Return the number of
+    files written.
+    """
+    pending = []
+    count = 0
+    for file_path, records in batches:
+        sink.write_many(records)
+        pending.append(file_path)
+        count += 1
+        if len(pending) >= every:
+            log.commit(pending, sink.sync())
+            pending = []
+    if pending:
+        log.commit(pending, sink.sync())
+    return count
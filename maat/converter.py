@@ -1,3 +1,4 @@
+import collections
 import re
 import lxml.etree as ET
 
@@ -9,6 +10,10 @@ from maat.utils import (
     tag_localname,
 )
 
+# Bump this whenever a change alters the converted output, so that
+# manifests and caches built by an older converter are not trusted.
+CONVERTER_VERSION = "1"
+
 
 def in_supplied_element(element):
     """
@@ -17,6 +22,13 @@ def in_supplied_element(element):
     return is_inside_element(element, "supplied")
 
 
+def is_supplied(thing):
+    """
+    Does `thing` count as a `supplied` element for `in_supplied_element`?
+    """
+    return is_element(thing) and thing.tag == "supplied"
+
+
 def which_test_context(element):
     """
     What is the test context of an element?
@@ -54,86 +66,501 @@ def remove_gaps_from_supplied_text(text):
     return re.sub(r"([^.]+)", r"[\1]", text)
 
 
+class Tag(collections.namedtuple("Tag", ["name", "kind"])):
+    """
+    A tag of the converter's output: an "empty" element, or the "start" or
+    "end" of one. Its string is its markup.
+    """
+
+    def __str__(self):
+        if self.kind == "start":
+            return f"<{self.name}>"
+        if self.kind == "end":
+            return f"</{self.name}>"
+        return f"<{self.name} />"
+
+
+GAP = Tag("gap", "empty")
+SUPPLIED_START = Tag("supplied", "start")
+SUPPLIED_END = Tag("supplied", "end")
+ALT_START = Tag("alt", "start")
+ALT_END = Tag("alt", "end")
+
+
+def fragments(converted):
+    """
+    The fragments of converted content: text and `Tag`s
+    """
+    return converted if isinstance(converted, list) else [converted]
+
+
+def joined(parts):
+    """
+    Join converted content: a string, or a list of text and `Tag`s when it
+    holds any tags
+    >>> joined(["a", "b"])
+    'ab'
+    >>> joined(["a", [GAP, "b"]])
+    ['a', Tag(name='gap', kind='empty'), 'b']
+    """
+    if all(is_text(part) for part in parts):
+        return "".join(parts)
+    content = []
+    for part in parts:
+        if isinstance(part, list):
+            content.extend(part)
+        else:
+            content.append(part)
+    return content
+
+
+def markup_text(converted):
+    """
+    Converted content as supplied-only markup
+    >>> markup_text(["a", GAP])
+    'a<gap />'
+    """
+    return "".join(str(fragment) for fragment in fragments(converted))
+
+
+def supplied_markup(converted):
+    """
+    Mark up the converted content of a lost or illegible `supplied`
+    element, leaving any gaps in it outside of the markup, as
+    `remove_gaps_from_supplied_text` does.
+    >>> markup_text(supplied_markup("abd.efg"))
+    '<supplied>abd</supplied>.<supplied>efg</supplied>'
+    """
+    text = markup_text(converted)
+    if "[" in text or "]" in text:
+        raise ValueError(f"Nested brackets in {text}")
+    marked = []
+    inside = False
+    for fragment in fragments(converted):
+        pieces = re.split(r"(\.+)", fragment) if is_text(fragment) else [fragment]
+        for piece in pieces:
+            if not piece:
+                continue
+            if is_text(piece) and piece.startswith("."):
+                if inside:
+                    marked.append(SUPPLIED_END)
+                    inside = False
+            elif not inside:
+                marked.append(SUPPLIED_START)
+                inside = True
+            marked.append(piece)
+    if inside:
+        marked.append(SUPPLIED_END)
+    return joined(marked)
+
+
+def alternatives_markup(converted):
+    """
+    Mark up the converted alternatives of a choice or app element
+    >>> alternatives_markup(["a"])
+    'a'
+    >>> markup_text(alternatives_markup(["a", "b"]))
+    '<alt>a</alt><alt>b</alt>'
+    """
+    if len(converted) == 1:
+        return converted[0]
+    return joined([[ALT_START, *fragments(c), ALT_END] for c in converted])
+
+
+def joined_supplied_markup(parts):
+    return supplied_markup(joined(parts))
+
+
+def strip_dots(converted):
+    """
+    Converted content without leading and trailing '.' characters
+    """
+    if is_text(converted):
+        return converted.strip(".")
+    content = list(converted)
+    while content and is_text(content[0]):
+        content[0] = content[0].lstrip(".")
+        if content[0]:
+            break
+        del content[0]
+    while content and is_text(content[-1]):
+        content[-1] = content[-1].rstrip(".")
+        if content[-1]:
+            break
+        del content[-1]
+    return joined(content)
+
+
+def drop_blanks(items):
+    """
+    Drop the blank text of an element until it has held other text, as
+    `XMLParser(remove_blank_text=True)` does with the blanks between
+    elements. Blank text that is all the element holds is kept.
+    """
+    if len(items) == 1:
+        return
+    kept = []
+    has_text = False
+    for item in items:
+        if is_text(item):
+            if not item.strip(" \t\n\r") and not has_text:
+                continue
+            has_text = True
+        kept.append(item)
+    items[:] = kept
+
+
+def content_items(converted):
+    """
+    The elements of converted content, as a list of text and
+    `(name, items)` pairs. An end tag closes the element it names, with any
+    left open inside it, and is dropped if there is no such element open.
+    """
+    ab = []
+    open_items = [ab]
+    open_names = [None]
+    for fragment in fragments(converted):
+        items = open_items[-1]
+        if is_text(fragment):
+            if not fragment:
+                continue
+            if items and is_text(items[-1]):
+                items[-1] += fragment
+            else:
+                items.append(fragment)
+        elif fragment.kind == "end":
+            for depth in range(len(open_names) - 1, 0, -1):
+                if open_names[depth] == fragment.name:
+                    for closed in open_items[depth:]:
+                        drop_blanks(closed)
+                    del open_items[depth:], open_names[depth:]
+                    break
+        else:
+            element = (fragment.name, [])
+            items.append(element)
+            if fragment.kind == "start":
+                open_items.append(element[1])
+                open_names.append(fragment.name)
+    for items in open_items:
+        drop_blanks(items)
+    return ab
+
+
+def add_items(parent, items):
+    for item in items:
+        if is_text(item):
+            if len(parent):
+                parent[-1].tail = item
+            else:
+                parent.text = item
+        else:
+            name, children = item
+            add_items(ET.SubElement(parent, name), children)
+
+
+def build_ab(converted):
+    """
+    Build the <ab> element of converted content (see `content_items`)
+    """
+    ab = ET.Element("ab")
+    add_items(ab, content_items(converted))
+    return ab
+
+
+def first_text(items):
+    """
+    An element's text, as `create_training_text` leaves it: None if blank
+    """
+    if items and is_text(items[0]) and items[0].strip():
+        return items[0]
+    return None
+
+
+def supplied_training_text(items):
+    """
+    What `create_training_text` replaces a supplied element with: its
+    first value, in brackets
+    """
+    if first_text(items) is not None:
+        return f"[{items[0]}]"
+    for item in items:
+        if not is_text(item):
+            return f"[{first_text(item[1])}]"
+    return ""
+
+
+def items_training_text(items):
+    parts = []
+    for index, item in enumerate(items):
+        if is_text(item):
+            if index or first_text(items) is not None:
+                parts.append(item)
+            continue
+        name, children = item
+        if name == "supplied":
+            parts.append(supplied_training_text(children))
+            continue
+        if first_text(children) is None and all(map(is_text, children)):
+            parts.append(f"<{name}/>")
+        else:
+            inner = items_training_text(children)
+            parts.append(f"<{name}>{inner}</{name}>")
+    return "".join(parts)
+
+
+def content_training_text(converted):
+    """
+    The training text of converted content: what `create_training_text`
+    makes of the <ab> built from it, without the <ab> tags, taken straight
+    from its elements (see `content_items`) rather than from a serialized
+    tree. Text is left as it is.
+    >>> content_training_text(["a", SUPPLIED_START, "b", SUPPLIED_END, " ", GAP])
+    'a[b] <gap/>'
+    """
+    return items_training_text(content_items(converted))
+
+
+TEI_NS = "http://www.tei-c.org/ns/1.0"
+
+
+def clark_names(tag):
+    """
+    The keys a handler for `tag` is registered under: its TEI Clark name,
+    as lxml reports namespaced tags, and the bare tag
+    >>> clark_names("ab")
+    ['{http://www.tei-c.org/ns/1.0}ab', 'ab']
+    """
+    return [f"{{{TEI_NS}}}{tag}", tag]
+
+
+def handles(tag):
+    """
+    Mark a `Converter` method as the handler for `tag`
+    """
+
+    def mark(func):
+        func.handled_tags = getattr(func, "handled_tags", ()) + (tag,)
+        return func
+
+    return mark
+
+
+ENGINES = ["recursive", "iterative"]
+
+# tags whose handler converts all the children and joins them
+JOINED_TAGS = [
+    "ab",
+    "abbr",
+    "add",
+    "expan",
+    "foreign",
+    "hi",
+    "lem",
+    "num",
+    "orig",
+    "q",
+    "rdg",
+    "seg",
+    "sic",
+    "subst",
+    "surplus",
+    "unclear",
+]
+
+# tags whose handler drops the element and its content
+DROPPED_TAGS = [
+    "certainty",
+    "del",
+    "ex",
+    "figure",
+    "g",
+    "handShift",
+    "milestone",
+    "note",
+]
+
+
 class Converter:
-    def __init__(self, raise_on_error=False):
-        self.tag_handlers = {}
+    """
+    Convert TEI `ab` elements to supplied-only markup.
+
+    There are two engines with the same handler semantics. The "recursive"
+    engine calls the `*_text` handlers, which recurse into their children.
+    The "iterative" engine walks the tree with an explicit stack, using the
+    handlers' plans (see `element_plan`), so deep nesting costs neither
+    Python frames nor recursion limit. In both, `depth` is the nesting level
+    being converted and `max_depth` the deepest level reached.
+    """
+
+    # Clark name (and bare tag) -> handler function, built once per class
+    tag_handlers = {}
+    # the same keys -> plan function, for the iterative engine
+    tag_plans = {}
+
+    def __init__(self, raise_on_error=False, engine="recursive"):
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine {engine}; must be one of {ENGINES}")
         self.raise_on_error = raise_on_error
+        self.engine = engine
+        self.reset()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.compile_tag_handlers()
+
+    def reset(self):
+        """
+        Forget the errors and depth of earlier conversions, so that one
+        converter can be reused across blocks and files
+        """
         self.errors = []
-        self.iniitalize_tag_handlers()
+        # the tag of the element each error was found in, if any
+        self.error_tags = []
         self.depth = 0
+        self.max_depth = 0
+        self.supplied_depth = 0
 
-    def error(self, e):
+    def error(self, e, tag=None):
         self.errors.append(e)
+        self.error_tags.append(tag)
         if self.raise_on_error:
             raise e
 
-    def register_tag_handler(self, tag):
-        # the func is the method named `tag` + '_text'
-        func = getattr(self, f"{tag}_text")
-        self.tag_handlers[tag] = func
-        return func
+    @classmethod
+    def compile_tag_handlers(cls):
+        """
+        Build the handler table of `cls`: the handlers of its bases, the
+        methods it marks with `handles`, and the methods it overrides by name
+        """
+        handlers = {}
+        for base in reversed(cls.__mro__[1:]):
+            handlers.update(vars(base).get("tag_handlers", {}))
+        for func in list(vars(cls).values()):
+            for tag in getattr(func, "handled_tags", ()):
+                handlers.update(dict.fromkeys(clark_names(tag), func))
+        for key, func in handlers.items():
+            override = vars(cls).get(func.__name__)
+            if hasattr(func, "handled_tags") and callable(override):
+                handlers[key] = override
+        cls.tag_handlers = handlers
+        cls.compile_tag_plans()
+
+    @classmethod
+    def compile_tag_plans(cls):
+        """
+        Plans for the iterative engine. A tag without a plan (a leaf, like
+        `gap`, or one whose built-in handler has been replaced) has its
+        handler called.
+        """
+        plan_names = dict.fromkeys(JOINED_TAGS, "joined_plan")
+        plan_names.update(dict.fromkeys(DROPPED_TAGS, "dropped_plan"))
+        plan_names.update(app="app_plan", choice="choice_plan")
+        plan_names["supplied"] = "supplied_plan"
+        cls.tag_plans = {}
+        for tag, plan_name in plan_names.items():
+            builtin = vars(Converter)[f"{tag}_text"]
+            plan = getattr(cls, plan_name)
+            for key in clark_names(tag):
+                if cls.tag_handlers.get(key) is builtin:
+                    cls.tag_plans[key] = plan
+
+    @classmethod
+    def register_tag_handler(cls, tag, func=None):
+        """
+        Register `func(converter, element)` as the handler for `tag` on this
+        class, and on subclasses defined after it. Without `func`, return a
+        decorator:
+
+            @Converter.register_tag_handler("persName")
+            def persName_text(converter, element):
+                return converter.default_handler(element)
+        """
+
+        def register(func):
+            cls.tag_handlers.update(dict.fromkeys(clark_names(tag), func))
+            cls.compile_tag_plans()
+            return func
+
+        if func is None:
+            return register
+        return register(func)
+
+    def tag_key(self, element):
+        """
+        The key of `element`'s handler in `tag_handlers`, or None (an error)
+        """
+        tag = element.tag
+        if tag in self.tag_handlers:
+            return tag
+        # another namespace; fall back to the local name
+        tag = tag_localname(element)
+        if tag in self.tag_handlers:
+            return tag
+        self.error(ValueError(f"No handler for {tag}"), tag)
+        return None
+
+    def post_process(self, converted):
+        """
+        Post-process the converted content into an <ab> element. Remove
+        wholly empty lines.
+        """
+        return build_ab(self.post_process_text(converted))
 
-    def iniitalize_tag_handlers(self):
-        # TODO: There must be a way to create decorators for this
-        self.register_tag_handler("ab")
-        self.register_tag_handler("abbr")
-        self.register_tag_handler("add")
-        self.register_tag_handler("app")
-        self.register_tag_handler("certainty")
-        self.register_tag_handler("choice")
-        self.register_tag_handler("del")
-        self.register_tag_handler("expan")
-        self.register_tag_handler("ex")
-        self.register_tag_handler("figure")
-        self.register_tag_handler("foreign")
-        self.register_tag_handler("g")
-        self.register_tag_handler("gap")
-        self.register_tag_handler("handShift")
-        self.register_tag_handler("hi")
-        self.register_tag_handler("lb")
-        self.register_tag_handler("lem")
-        self.register_tag_handler("milestone")
-        self.register_tag_handler("note")
-        self.register_tag_handler("num")
-        self.register_tag_handler("orig")
-        self.register_tag_handler("q")
-        self.register_tag_handler("rdg")
-        self.register_tag_handler("seg")
-        self.register_tag_handler("sic")
-        self.register_tag_handler("subst")
-        self.register_tag_handler("supplied")
-        self.register_tag_handler("surplus")
-        self.register_tag_handler("unclear")
-
-    def post_process(self, text):
-        """
-        Post-process the text. Remove wholly empty lines.
+    def post_process_text(self, converted):
+        """
+        Remove wholly empty lines and leading and trailing '.' characters
+        from converted content.
         """
 
         def is_empty_line(line):
             return re.match(r"(-- )+", line)
 
-        lines = [
-            line
-            for line in text.split("\n")
-            if line and not line.isspace() and not is_empty_line(line)
-        ]
-        txt = "\n".join(lines)
+        lines = [[]]
+        for fragment in fragments(converted):
+            if is_text(fragment):
+                first, *rest = fragment.split("\n")
+                lines[-1].append(first)
+                lines.extend([piece] for piece in rest)
+            else:
+                lines[-1].append(fragment)
+        kept = []
+        for line in lines:
+            text = markup_text(line)
+            if text and not text.isspace() and not is_empty_line(text):
+                kept.extend(["\n", *line] if kept else line)
         # remove leading and trailing '.' characters
-        txt = txt.strip(".")
-        # wrap in a <ab> element
-        txt = f"<ab>{txt}</ab>"
-        return ET.fromstring(
-            txt,
-            parser=ET.XMLParser(recover=True, remove_blank_text=True),
-        )
+        return strip_dots(joined(kept))
+
+    def content(self, element):
+        """
+        Convert an element to post-processed content: text, or a list of
+        text and `Tag`s
+        """
+        self.depth = 0
+        self.max_depth = 0
+        # the one ancestor walk; below `element` the count is carried down
+        self.supplied_depth = int(in_supplied_element(element.getparent()))
+        if self.engine == "iterative":
+            return self.post_process_text(self._convert_iteratively(element))
+        return self.post_process_text(self._convert(element))
+
+    def markup(self, element):
+        """
+        Convert an element to post-processed supplied-only markup, as a string
+        """
+        return markup_text(self.content(element))
 
     def convert(self, element):
         """
         Convert an element to supplied-only ab format
         """
-        self.depth = 0
-        return self.post_process(self._convert(element))
+        return build_ab(self.content(element))
+
+    def training_text(self, element):
+        """
+        Convert an element to its training text
+        """
+        return content_training_text(self.content(element))
 
     def __call__(self, element):
         return self.convert(element)
@@ -150,32 +577,51 @@ class Converter:
         return text
 
     def handle_element(self, element):
-        tag = tag_localname(element)
-        handler = self.tag_handlers.get(tag, None)
-        if handler is None:
-            self.error(ValueError(f"No handler for {tag}"))
-            return self.default_handler(element)
-        return handler(element)
+        supplied = is_supplied(element)
+        self.supplied_depth += supplied
+        key = self.tag_key(element)
+        if key is None:
+            text = self.default_handler(element)
+        else:
+            text = self.tag_handlers[key](self, element)
+        self.supplied_depth -= supplied
+        return text
 
     def default_handler(self, element):
         if element is None:
             return ""
-        text = ""
+        parts = []
         for child in children(element):
-            self.depth += 1
-            text += self._convert(child)
-            # self.depth -= 1
-        return text
+            self.enter()
+            parts.append(self._convert(child))
+            self.depth -= 1
+        return joined(parts)
+
+    def test_context(self):
+        """
+        The test context of the element being converted (see
+        `which_test_context`), from the count of enclosing `supplied` elements
+        """
+        return "evaluation" if self.supplied_depth else "context"
 
+    def enter(self):
+        self.depth += 1
+        if self.depth > self.max_depth:
+            self.max_depth = self.depth
+
+    @handles("ab")
     def ab_text(self, element):
         return self.default_handler(element)
 
+    @handles("abbr")
     def abbr_text(self, element):
         return self.default_handler(element)
 
+    @handles("add")
     def add_text(self, element):
         return self.default_handler(element)
 
+    @handles("app")
     def app_text(self, element):
         """
         Extract text from app elements.
@@ -186,9 +632,11 @@ class Converter:
         ok_tags = ["lem", "rdg"]
         return self.text_from_acceptable_children(element, ok_tags)
 
+    @handles("certainty")
     def certainty_text(self, element):
         return ""
 
+    @handles("choice")
     def choice_text(self, element):
         """
         Extract text from choice elements. We take the first choice.
@@ -197,97 +645,116 @@ class Converter:
         ok_tags = ["abbr", "choice", "orig", "sic", "unclear"]
         return self.text_from_acceptable_children(element, ok_tags)
 
+    @handles("del")
     def del_text(self, element):
         return ""
 
+    @handles("expan")
     def expan_text(self, element):
         return self.default_handler(element)
 
+    @handles("ex")
     def ex_text(self, element):
         return ""
 
+    @handles("figure")
     def figure_text(self, element):
         return ""
 
+    @handles("foreign")
     def foreign_text(self, element):
         return self.default_handler(element)
 
+    @handles("g")
     def g_text(self, element):
         return ""
 
+    @handles("gap")
     def gap_text(self, element):
         """
         Extract text from gap elements.
         """
         if element.get("unit") == "line":
-            return "<gap />"
+            return [GAP]
         amt_txt = element.get("quantity", "unknown")
         if amt_txt == "unknown":
-            return "<gap />"
+            return [GAP]
         amt = 0
         try:
             amt = int(amt_txt)
         except ValueError:
-            self.error(ValueError(f"Invalid quantity: {amt_txt}"))
-            return "<gap />"
+            self.error(ValueError(f"Invalid quantity: {amt_txt}"), "gap")
+            return [GAP]
         return "." * amt
 
+    @handles("handShift")
     def handShift_text(self, element):
         return ""
 
+    @handles("hi")
     def hi_text(self, element):
         return self.default_handler(element)
 
+    @handles("lb")
     def lb_text(self, element):
         return "\n"
 
+    @handles("lem")
     def lem_text(self, element):
         return self.default_handler(element)
 
+    @handles("milestone")
     def milestone_text(self, element):
         return ""
 
+    @handles("note")
     def note_text(self, element):
         return ""
 
+    @handles("num")
     def num_text(self, element):
         return self.default_handler(element)
 
+    @handles("orig")
     def orig_text(self, element):
         return self.default_handler(element)
 
+    @handles("q")
     def q_text(self, element):
         return self.default_handler(element)
 
+    @handles("rdg")
     def rdg_text(self, element):
         return self.default_handler(element)
 
+    @handles("seg")
     def seg_text(self, element):
         return self.default_handler(element)
 
+    @handles("sic")
     def sic_text(self, element):
         return self.default_handler(element)
 
+    @handles("subst")
     def subst_text(self, element):
         return self.default_handler(element)
 
+    @handles("supplied")
     def supplied_text(self, element):
         """
         Extract text from supplied elements.
         """
         if element.get("reason") in ["lost", "illegible"]:
-            repaired = remove_gaps_from_supplied_text(
-                "[" + self.default_handler(element) + "]"
-            )
-            # replace brackets with supplied tag
-            return re.sub(r"\[([^\[\]]+)\]", r"<supplied>\1</supplied>", repaired)
+            return supplied_markup(self.default_handler(element))
 
         else:
             return ""  # some other reason, probably 'omitted' or 'undefined'
 
+    @handles("surplus")
     def surplus_text(self, element):
         return self.default_handler(element)
 
+    @handles("unclear")
     def unclear_text(self, element):
         return self.default_handler(element)
 
@@ -299,29 +766,143 @@ class Converter:
         ok_children = [
             child for child in element if tag_localname(child) in acceptable_tags
         ]
-        if which_test_context(element) == "context":
+        context = self.test_context()
+        if context == "context":
             if ok_children:
-                self.depth += 1
+                self.enter()
                 text = self._convert(ok_children[0])
-                # self.depth -= 1
+                self.depth -= 1
                 return text
             else:
                 self.error(
                     ValueError(
                         f"No acceptable choice; must be one of {', '.join(acceptable_tags)}"
-                    )
+                    ),
+                    tag_localname(element),
                 )
                 return ""
-        elif which_test_context(element) == "evaluation":
+        elif context == "evaluation":
             converted = []
             for child in ok_children:
-                self.depth += 1
+                self.enter()
                 converted.append(self._convert(child))
-                # self.depth -= 1
-            if len(converted) == 1:
-                return converted[0]
-            else:
-                return "<alt>" + "</alt><alt>".join(converted) + "</alt>"
+                self.depth -= 1
+            return alternatives_markup(converted)
+        else:
+            self.error(
+                ValueError("Unknown context for choice element"),
+                tag_localname(element),
+            )
+            return ""
+
+    # The iterative engine
+    #
+    # A plan says how to convert an element: either its finished text, or a
+    # pair (children, finish) of the children to convert and a function
+    # turning the list of their converted texts into the element's text.
+
+    def joined_plan(self, element):
+        return children(element), joined
+
+    def dropped_plan(self, element):
+        return ""
+
+    def app_plan(self, element):
+        t = element.get("type", "unknown")
+        if t != "alternative":
+            return ""
+        return self.acceptable_children_plan(element, ["lem", "rdg"])
+
+    def choice_plan(self, element):
+        ok_tags = ["abbr", "choice", "orig", "sic", "unclear"]
+        return self.acceptable_children_plan(element, ok_tags)
+
+    def supplied_plan(self, element):
+        if element.get("reason") in ["lost", "illegible"]:
+            return children(element), joined_supplied_markup
+        return ""
+
+    def acceptable_children_plan(self, element, acceptable_tags):
+        """
+        The plan counterpart of `text_from_acceptable_children`
+        """
+        ok_children = [
+            child for child in element if tag_localname(child) in acceptable_tags
+        ]
+        context = self.test_context()
+        if context == "context":
+            if ok_children:
+                return ok_children[:1], joined
+            self.error(
+                ValueError(
+                    f"No acceptable choice; must be one of {', '.join(acceptable_tags)}"
+                ),
+                tag_localname(element),
+            )
+            return ""
+        elif context == "evaluation":
+            return ok_children, alternatives_markup
         else:
-            self.error(ValueError("Unknown context for choice element"))
+            self.error(
+                ValueError("Unknown context for choice element"),
+                tag_localname(element),
+            )
             return ""
+
+    def element_plan(self, element):
+        plan = self.tag_plans.get(element.tag)
+        if plan is not None:
+            return plan(self, element)
+        key = self.tag_key(element)
+        if key is None:
+            return self.joined_plan(element)
+        plan = self.tag_plans.get(key)
+        if plan is None:
+            return self.tag_handlers[key](self, element)
+        return plan(self, element)
+
+    def thing_plan(self, thing):
+        if is_text(thing):
+            return self.handle_text(thing)
+        if is_element(thing):
+            return self.element_plan(thing)
+        self.error(ValueError(f"Cannot handle {thing}"))
+
+    def _convert_iteratively(self, thing):
+        """
+        Convert with an explicit stack of (children, finish, converted,
+        supplied) frames, `supplied` saying whether the frame's element
+        counts towards `supplied_depth`
+        """
+        supplied = is_supplied(thing)
+        self.supplied_depth += supplied
+        plan = self.thing_plan(thing)
+        if not isinstance(plan, tuple):
+            self.supplied_depth -= supplied
+            return plan
+        stack = [(iter(plan[0]), plan[1], [], supplied)]
+        while True:
+            pending, finish, converted, supplied = stack[-1]
+            child = next(pending, None)
+            if child is None:
+                stack.pop()
+                self.depth = max(len(stack) - 1, 0)
+                self.supplied_depth -= supplied
+                text = finish(converted)
+                if not stack:
+                    return text
+                stack[-1][2].append(text)
+                continue
+            self.enter()
+            supplied = is_supplied(child)
+            self.supplied_depth += supplied
+            plan = self.thing_plan(child)
+            if isinstance(plan, tuple):
+                stack.append((iter(plan[0]), plan[1], [], supplied))
+            else:
+                converted.append(plan)
+                self.depth -= 1
+                self.supplied_depth -= supplied
+
+
+Converter.compile_tag_handlers()
@@ -5,7 +5,6 @@ from maat.utils import (
     is_text,
     replace_element,
     replace_element_with_text,
-    mode_length,
     to_string,
 )
 
@@ -58,3 +57,42 @@ def create_test_cases(text):
         post_masked_text = text[end:].replace("[", "").replace("]", "")
         mask = "." * (end - start - 2)
         yield f"{pre_masked_text}[{mask}]{post_masked_text}"
+
+
+def mask_spans(text):
+    """
+    The compact form of `create_test_cases(text)`: the training text without
+    brackets, and for each test case the span of the plain text it masks.
+    A span is `[start, end]`, or `[start, end, mask_length]` when the mask
+    is not as long as the span (the masked text contained a "[").
+    >>> mask_spans("a[bc]d[e]")
+    ('abcde', [[1, 3], [4, 5]])
+    """
+    spans = []
+    removed = 0
+    scanned = 0
+    for match in re.finditer(r"\[[^\]]+\]", text):
+        start, end = match.start(), match.end()
+        removed += text.count("[", scanned, start) + text.count("]", scanned, start)
+        inner = text.count("[", start + 1, end - 1)
+        plain_start = start - removed
+        plain_end = end - removed - 2 - inner
+        mask_length = end - start - 2
+        if mask_length == plain_end - plain_start:
+            spans.append([plain_start, plain_end])
+        else:
+            spans.append([plain_start, plain_end, mask_length])
+        removed += 2 + inner
+        scanned = end
+    return text.replace("[", "").replace("]", ""), spans
+
+
+def materialize_test_case(plain_text, span):
+    """
+    Rebuild one test case from a `mask_spans` span
+    >>> materialize_test_case("abcde", [1, 3])
+    'a[..]de'
+    """
+    start, end = span[0], span[1]
+    mask_length = span[2] if len(span) > 2 else end - start
+    return f"{plain_text[:start]}[{'.' * mask_length}]{plain_text[end:]}"
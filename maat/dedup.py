@@ -0,0 +1,230 @@
+import array
+import json
+import random
+import re
+import tempfile
+import unicodedata
+import zlib
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# The Mersenne prime the permutations of shingle hashes work modulo; products
+# of numbers below it stay below 2 ** 64, so numpy computes them exactly
+_PRIME = (1 << 31) - 1
+
+# What deduplication does with a near-duplicate block
+DEDUP_ACTIONS = ["tag", "drop"]
+
+
+def normalized_text(training_text):
+    """
+    A training text without what editions of the same text tend to differ
+    in: brackets, gaps, lost characters, accents, case and spacing
+    """
+    text = training_text.replace("<gap/>", " ")
+    text = re.sub(r"[\[\].]", "", text)
+    text = "".join(
+        c for c in unicodedata.normalize("NFD", text) if not unicodedata.combining(c)
+    )
+    return " ".join(text.lower().split())
+
+
+def shingle_hashes(text, size=5):
+    """
+    The 32-bit hashes of the character `size`-grams of `text` (of the whole
+    text, if it is shorter)
+    """
+    if not text:
+        return set()
+    if len(text) <= size:
+        return {zlib.crc32(text.encode("utf-8"))}
+    return {
+        zlib.crc32(text[i : i + size].encode("utf-8"))
+        for i in range(len(text) - size + 1)
+    }
+
+
+def lsh_bands(num_perm, threshold):
+    """
+    The `(bands, rows)` splitting a signature of `num_perm` values whose
+    S-curve turns closest to `threshold`: blocks about that similar share
+    a band about half the time, more similar ones almost always
+    """
+    choices = [
+        (bands, num_perm // bands)
+        for bands in range(1, num_perm + 1)
+        if num_perm % bands == 0
+    ]
+    return min(
+        choices, key=lambda choice: abs((1 / choice[0]) ** (1 / choice[1]) - threshold)
+    )
+
+
+class Deduplicator:
+    """
+    Find near-duplicate blocks in one pass, with MinHash and LSH.
+
+    Each block's normalized training text (see `normalized_text`) is cut
+    into character shingles, and summarized by a MinHash signature of
+    `num_perm` values, whose share of equal values estimates the Jaccard
+    similarity of two blocks' shingles. The signature is cut into bands;
+    only blocks sharing a band are compared, so the work grows with the
+    number of blocks rather than with the number of pairs. A block is a
+    near-duplicate of the first earlier block it is at least `threshold`
+    similar to.
+
+    Only the blocks that are not near-duplicates are kept in memory, with
+    their ids, signatures (`num_perm` × 4 bytes a block) and band buckets,
+    not their texts. Near-duplicates are only written to a temporary file,
+    to list the clusters from at the end. numpy, if installed, makes
+    signatures faster to compute; they are the same without it.
+    """
+
+    def __init__(self, threshold=0.8, num_perm=64, shingle_size=5, seed=1):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.bands, self.rows = lsh_bands(num_perm, threshold)
+        rng = random.Random(seed)
+        self.a = [rng.randrange(1, _PRIME) for _ in range(num_perm)]
+        self.b = [rng.randrange(0, _PRIME) for _ in range(num_perm)]
+        # of the blocks kept: their ids, signatures and positions in the run
+        self.ids = []
+        self.signatures = array.array("I")
+        self.positions = array.array("Q")
+        self.buckets = [{} for _ in range(self.bands)]
+        # the cluster of each kept block, as the index of its first block
+        self.parents = array.array("Q")
+        self.blocks = 0
+        self.duplicates = 0
+        # a JSON line `[kept block index, position, id]` for each duplicate
+        self.spool = None
+
+    def signature(self, hashes):
+        if numpy is not None:
+            x = numpy.fromiter(hashes, dtype=numpy.uint64, count=len(hashes))
+            x %= numpy.uint64(_PRIME)
+            a = numpy.array(self.a, dtype=numpy.uint64)
+            b = numpy.array(self.b, dtype=numpy.uint64)
+            values = (x[:, None] * a + b) % numpy.uint64(_PRIME)
+            return [int(value) for value in values.min(axis=0)]
+        return [
+            min((a * (x % _PRIME) + b) % _PRIME for x in hashes)
+            for a, b in zip(self.a, self.b)
+        ]
+
+    def similarity(self, signature, index):
+        n = self.num_perm
+        other = self.signatures[index * n : (index + 1) * n]
+        return sum(1 for x, y in zip(signature, other) if x == y) / n
+
+    def cluster(self, index):
+        while self.parents[index] != index:
+            self.parents[index] = self.parents[self.parents[index]]
+            index = self.parents[index]
+        return index
+
+    def add(self, record):
+        """
+        Index a record's block, and return the id of the first block of the
+        cluster it is a near-duplicate in, or None
+        """
+        position = self.blocks
+        self.blocks += 1
+        hashes = shingle_hashes(
+            normalized_text(record["training_text"]), self.shingle_size
+        )
+        if not hashes:
+            # nothing to compare, and nothing to keep
+            return None
+        signature = self.signature(hashes)
+        keys = [
+            hash(tuple(signature[band * self.rows : (band + 1) * self.rows]))
+            for band in range(self.bands)
+        ]
+        candidates = []
+        for buckets, key in zip(self.buckets, keys):
+            candidates.extend(buckets.get(key, ()))
+        match = None
+        for candidate in sorted(set(candidates)):
+            if self.similarity(signature, candidate) >= self.threshold:
+                root = self.cluster(candidate)
+                if match is None:
+                    match = root
+                elif root != match:
+                    # two clusters meet in this block; the earlier one absorbs
+                    first, second = sorted([root, match])
+                    self.parents[second] = first
+                    match = first
+        if match is None:
+            index = len(self.ids)
+            self.ids.append(record["id"])
+            self.signatures.extend(signature)
+            self.positions.append(position)
+            self.parents.append(index)
+            for buckets, key in zip(self.buckets, keys):
+                buckets.setdefault(key, []).append(index)
+            return None
+        # not kept: later copies are found through the blocks it is like, so
+        # that a large cluster does not make each one be compared with all
+        # the others
+        if self.spool is None:
+            self.spool = tempfile.TemporaryFile("w+", encoding="utf-8")
+        self.spool.write(json.dumps([match, position, record["id"]]) + "\n")
+        self.duplicates += 1
+        return self.ids[match]
+
+    def filter(self, records, action="tag"):
+        """
+        Yield `records`, with a `duplicate_of` field naming the first block
+        of their cluster on near-duplicates, or without the near-duplicates
+        """
+        if action not in DEDUP_ACTIONS:
+            raise ValueError(f"Unknown action {action}; must be one of {DEDUP_ACTIONS}")
+        for record in records:
+            duplicate_of = self.add(record)
+            if duplicate_of is None:
+                yield record
+            elif action == "tag":
+                yield {**record, "duplicate_of": duplicate_of}
+
+    def clusters(self):
+        """
+        The ids of the blocks of each cluster of near-duplicates, first
+        block first
+        """
+        members = {}
+        for index in range(len(self.ids)):
+            members.setdefault(self.cluster(index), []).append(
+                (self.positions[index], self.ids[index])
+            )
+        if self.spool is not None:
+            self.spool.seek(0)
+            for line in self.spool:
+                index, position, id = json.loads(line)
+                members[self.cluster(index)].append((position, id))
+            self.spool.seek(0, 2)
+        return [
+            [id for _, id in sorted(blocks)]
+            for blocks in members.values()
+            if len(blocks) > 1
+        ]
+
+    def summary(self):
+        clusters = self.clusters()
+        return {
+            "threshold": self.threshold,
+            "num_perm": self.num_perm,
+            "bands": self.bands,
+            "rows": self.rows,
+            "blocks": self.blocks,
+            "duplicates": self.duplicates,
+            "clusters": clusters,
+        }
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.summary(), file, indent=2, ensure_ascii=False)
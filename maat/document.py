@@ -0,0 +1,424 @@
+import io
+import os
+import re
+import logging
+import time
+import lxml.etree as ET
+
+from maat.utils import xml_parser
+
+our_namespaces = {
+    "tei": "http://www.tei-c.org/ns/1.0",
+    "xml": "http://www.w3.org/XML/1998/namespace",
+}
+
+
+def filepath_to_corpus_id(pathname):
+    if "idp.data/APD" in pathname:
+        return "APD"
+    if "idp.data/DCLP" in pathname:
+        return "DCLP"
+    if "idp.data/DDB_EpiDoc_XML" in pathname:
+        return "DDbDP"
+    if "edhEpidocDump_" in pathname:
+        return "EDH"
+    return "unknown"
+
+
+# Time spent parsing, apart from reading, by stage name ("parse" for
+# documents, "parse_hgv" for HGV files), once `record_parse_timings` is
+# called; see `take_parse_timings`
+_parse_timings = None
+
+
+def file_bytes(file_path):
+    """
+    read the raw contents of a file
+    """
+    with open(file_path, "rb") as file:
+        return file.read()
+
+
+def parse_bytes(data, what="document"):
+    """
+    parse the raw contents of a file into an XML document
+    lxml decodes them itself, following their encoding declaration
+    raise `ET.XMLSyntaxError` if not even a root element can be recovered
+    `what` is "document" or "hgv", and only matters to the parse timings
+    """
+    if _parse_timings is None:
+        root = ET.fromstring(data, xml_parser())
+    else:
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            root = ET.fromstring(data, xml_parser())
+        finally:
+            name = "parse" if what == "document" else f"parse_{what}"
+            timing = _parse_timings.setdefault(name, [0, 0.0, 0.0])
+            timing[0] += 1
+            timing[1] += time.perf_counter() - wall
+            timing[2] += time.process_time() - cpu
+    if root is None:
+        raise ET.XMLSyntaxError("no root element could be recovered", 0, 1, 1)
+    return root.getroottree()
+
+
+def record_parse_timings():
+    """
+    start recording parse timings in this process, afresh
+    """
+    global _parse_timings
+    _parse_timings = {}
+
+
+def take_parse_timings():
+    """
+    return the parse timings so far, as `{stage: {"calls", "wall", "cpu"}}`,
+    and start afresh
+    """
+    if _parse_timings is None:
+        return {}
+    timings = {
+        name: {"calls": calls, "wall": wall, "cpu": cpu}
+        for name, (calls, wall, cpu) in _parse_timings.items()
+    }
+    _parse_timings.clear()
+    return timings
+
+
+def read_file(file_path, data=None, what="document"):
+    """
+    read the file and return the content as an XML document
+    if its contents have already been read, they can be given as `data` bytes
+    """
+    if data is None:
+        data = file_bytes(file_path)
+    return parse_bytes(data, what)
+
+
+# XML functions
+
+
+def papyri_info_data_path(pathname):
+    orig_pathname = pathname
+    # Splitting the pathname into parts
+    parts = []
+    while True:
+        parts.append(os.path.basename(pathname))
+        pathname, tail = os.path.split(pathname)
+        if not tail:
+            break
+        if os.path.basename(pathname) == "idp.data":
+            break
+    parts = parts[::-1]  # Reverse to get the correct order
+
+    # Joining the parts again
+    joined_path = os.path.join(*parts)
+    data_part = orig_pathname.removesuffix(joined_path)
+    return data_part
+
+
+def hgv_filename_from_idno(idno, filepath):
+    """
+    given an HGV idno, return the filename
+    the top level folder is source_dir/../HGV_meta_EpiDoc
+    the enclosing folder is "HGV" + int(idno) // 1000 + 1
+    the filename is idno + ".xml"
+    to get the top level folder, we need the source_dir, which
+    we get from the filepath.
+    For example, if the filepath is `/Users/willf/projects/papyri/idp.data/DCLP/990/989335.xml`
+    then the top level folder is `/Users/willf/projects/papyri/idp.data/HGV_meta_EpiDoc`
+    """
+    source_dir = papyri_info_data_path(filepath)
+    if source_dir == "/":
+        return "unknown"
+
+    top_level_folder = os.path.join(source_dir, "HGV_meta_EpiDoc")
+    if idno == "unknown":
+        return "unknown"
+    # get the integer part ... the digits from the start
+    integer_part = re.match(r"\d+", idno)
+    if integer_part is None:
+        return "unknown"
+    integer_part = integer_part.group()
+    folder = f"HGV{int(integer_part) // 1000}"
+    if int(integer_part) % 1000 != 0:
+        folder = f"HGV{int(integer_part) // 1000 + 1}"
+    filename = f"{idno}.xml"
+    return os.path.join(top_level_folder, folder, filename)
+
+
+def material_from_hgv_idno(idno, filepath, hgv_index=None):
+    """
+    given an HGV idno, return the material
+    if an `HGVIndex` covering the HGV file is given, look it up there
+    instead of parsing the file
+    """
+    hgv_file = hgv_filename_from_idno(idno, filepath)
+    if hgv_file == "unknown":
+        return "unknown"
+    if hgv_index is not None and hgv_index.covers(hgv_file):
+        hgv_material = hgv_index.material(hgv_file)
+        if hgv_material is None:
+            logging.warning(f"Error: HGV file {hgv_file} not found\n")
+            return "unknown"
+        return hgv_material
+    try:
+        # sys.stderr.write(f"Trying to get material from {hgv_file}\n")
+        hgv_doc = read_file(hgv_file, what="hgv")
+    except ET.ParseError:
+        logging.warning(f"Error parsing HGV file {hgv_file}")
+        return "unknown"
+    except FileNotFoundError:
+        logging.warning(f"Error: HGV file {hgv_file} not found\n")
+        return "unknown"
+    return header_material(read_header(hgv_doc), None)
+
+
+TEI_AB = "{http://www.tei-c.org/ns/1.0}ab"
+TEI_DIV = "{http://www.tei-c.org/ns/1.0}div"
+TEI_HEADER = "{http://www.tei-c.org/ns/1.0}teiHeader"
+TEI_IDNO = "{http://www.tei-c.org/ns/1.0}idno"
+TEI_MATERIAL = "{http://www.tei-c.org/ns/1.0}material"
+TEI_TEI = "{http://www.tei-c.org/ns/1.0}TEI"
+TEI_TITLE = "{http://www.tei-c.org/ns/1.0}title"
+XML_LANG = "{http://www.w3.org/XML/1998/namespace}lang"
+
+
+def is_edition(element):
+    """
+    Is the current element part of an enclosing div of type 'edition'?
+    """
+    parent = element.getparent()
+    while parent is not None:
+        if parent.tag == TEI_DIV and parent.get("type") == "edition":
+            return True
+        parent = parent.getparent()
+    return False
+
+
+def reported_language(element):
+    """
+    Extract the language of the current element or the first ancestor with a language attribute.
+    """
+    while element is not None:
+        lang = element.get(XML_LANG)
+        if lang is not None:
+            return lang
+        element = element.getparent()
+    return "unknown"
+
+
+def block_contexts(element, in_edition=False, lang="unknown"):
+    """
+    Yield `(ab, in_edition, lang)` for each `ab` in `element` (itself
+    included), in document order. Edition membership and the inherited
+    `xml:lang` are carried down a single walk, so they agree with
+    `is_edition` and `reported_language` without climbing the ancestors of
+    each block. `in_edition` and `lang` describe the ancestors of `element`.
+    """
+    stack = [(element, in_edition, lang)]
+    while stack:
+        element, in_edition, lang = stack.pop()
+        tag = element.tag
+        if not isinstance(tag, str):
+            # comments and processing instructions
+            continue
+        lang = element.get(XML_LANG, lang)
+        if tag == TEI_AB:
+            yield element, in_edition, lang
+        elif tag == TEI_DIV and element.get("type") == "edition":
+            in_edition = True
+        stack.extend((child, in_edition, lang) for child in reversed(element))
+
+
+def all_text(element):
+    return "".join(element.itertext())
+
+
+# Streaming ingestion
+
+
+def collect_header_field(header, element):
+    """
+    Record the header fields found in `element`, an element of the
+    teiHeader, into the `header` dict, keeping the first one of each kind,
+    as `doc.find` would.
+    A field is present in `header` only if its element was seen.
+    """
+    tag = element.tag
+    if tag == TEI_IDNO:
+        header.setdefault("idno", element.text)
+        idno_type = element.get("type")
+        if idno_type == "filename":
+            header.setdefault("idno_filename", element.text)
+        elif idno_type == "HGV":
+            header.setdefault("idno_hgv", element.text)
+    elif tag == TEI_TITLE:
+        header.setdefault("title", element.text)
+    elif tag == TEI_MATERIAL:
+        header.setdefault("material", element.text)
+
+
+def header_idno(header):
+    """
+    The idno of type 'filename' in the header fields, otherwise the first
+    one found
+    """
+    if "idno_filename" in header:
+        return header["idno_filename"]
+    return header.get("idno", "unknown")
+
+
+def header_idno_hgv(header):
+    """
+    The HGV idno in the header fields, up to its first space
+    """
+    text = header.get("idno_hgv")
+    if text is None:
+        return "unknown"
+    return text.split(" ")[0]
+
+
+def header_title(header):
+    """
+    The title in the header fields
+    """
+    return header["title"] if "title" in header else "unknown"
+
+
+def header_material(header, filepath, hgv_index=None):
+    """
+    The material in the header fields, or without one, the material of the
+    document's HGV metadata file
+    """
+    if "material" not in header and filepath:
+        return material_from_hgv_idno(header_idno_hgv(header), filepath, hgv_index)
+    if header.get("material"):
+        return header["material"]
+    return "unknown"
+
+
+_tei_header = ET.XPath("/tei:TEI/tei:teiHeader", namespaces=our_namespaces)
+
+
+def is_tei_header(element):
+    """
+    Is `element` the teiHeader of a document, right under its TEI root?
+    """
+    if element.tag != TEI_HEADER:
+        return False
+    parent = element.getparent()
+    return parent is not None and parent.tag == TEI_TEI and parent.getparent() is None
+
+
+def read_header(doc):
+    """
+    The header fields (see `collect_header_field`) of a parsed document,
+    found in a single walk over its teiHeader; a document without one has
+    none. Use `header_idno`, `header_title` and so on to read them, or
+    `header_metadata` to read them all.
+    """
+    header = {}
+    for scope in _tei_header(doc)[:1]:
+        for element in scope.iter(TEI_IDNO, TEI_TITLE, TEI_MATERIAL):
+            collect_header_field(header, element)
+    return header
+
+
+def header_metadata(header, filepath, hgv_index=None):
+    """
+    All the metadata found in the header fields: the `idno`, `idno_hgv`,
+    `title` and `material` (looked up in HGV if need be)
+    """
+    return {
+        "idno": header_idno(header),
+        "idno_hgv": header_idno_hgv(header),
+        "title": header_title(header),
+        "material": header_material(header, filepath, hgv_index),
+    }
+
+
+_edition_divs = ET.XPath(
+    "//tei:div[@type='edition'][not(ancestor::tei:div[@type='edition'])]",
+    namespaces=our_namespaces,
+)
+
+
+def edition_blocks(doc):
+    """
+    Yield `(ab, lang)` for each `ab` inside an edition `div` of `doc`, in
+    document order, as `block_contexts` would, but walking only the
+    outermost edition `div`s rather than the whole document
+    """
+    for div in _edition_divs(doc):
+        lang = reported_language(div.getparent())
+        for ab, _, ab_lang in block_contexts(div, True, lang):
+            yield ab, ab_lang
+
+
+def stream_abs(file_path, data=None):
+    """
+    Parse a file incrementally, yielding `(header, ab, lang)` for each `ab`
+    inside an edition `div`, as `edition_blocks` would, as soon as its
+    outermost enclosing `ab` is complete. `lang` is the block's
+    reported language, as `reported_language` would find it.
+
+    `header` is a dict of the header fields (see `collect_header_field`) of
+    the teiHeader, as `read_header` finds them; as the teiHeader comes
+    first, it is complete by the first `ab`.
+    Once the consumer is done with an `ab`, it is cleared, together with the
+    finished siblings before it, so memory depends on the size of a block
+    rather than the size of the file. Ancestors are kept, so `is_edition` and
+    `reported_language` still work on the yielded elements. If the file has
+    already been read, its contents can be given as `data` bytes.
+    """
+    source = io.BytesIO(data) if data is not None else file_path
+    header = {}
+    open_abs = 0
+    open_editions = 0
+    # whether we are inside the document's teiHeader
+    in_header = False
+    # the inherited xml:lang of each open element
+    langs = ["unknown"]
+    for event, element in ET.iterparse(
+        source, events=("start", "end"), recover=True, remove_blank_text=True
+    ):
+        tag = element.tag
+        if event == "start":
+            langs.append(element.get(XML_LANG, langs[-1]))
+            if tag == TEI_AB:
+                open_abs += 1
+            elif tag == TEI_DIV and element.get("type") == "edition":
+                open_editions += 1
+            elif is_tei_header(element):
+                in_header = True
+            continue
+        langs.pop()
+        if tag == TEI_AB:
+            open_abs -= 1
+        elif tag == TEI_DIV and element.get("type") == "edition":
+            open_editions -= 1
+        if open_abs:
+            # still inside an outer ab, which will be yielded as a whole
+            continue
+        if tag == TEI_AB:
+            # the outer ab first, then any nested ones, in document order;
+            # an ab outside the editions may still hold an edition div, so
+            # its blocks are looked for before it is cleared
+            for ab, in_edition, lang in block_contexts(
+                element, open_editions > 0, langs[-1]
+            ):
+                if in_edition:
+                    yield header, ab, lang
+        elif in_header:
+            if is_tei_header(element):
+                in_header = False
+            else:
+                collect_header_field(header, element)
+        element.clear(keep_tail=True)
+        parent = element.getparent()
+        if parent is not None:
+            while element.getprevious() is not None:
+                del parent[0]
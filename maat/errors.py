@@ -0,0 +1,77 @@
+import json
+import traceback
+
+
+class ErrorReport:
+    """
+    The errors of a run, counted by error type and tag, each with the first
+    `samples` examples.
+
+    Converter errors (see `Converter.errors`) have the tag of the element
+    they were found in; failures to read a file or convert a block have
+    none. An example says where the error happened and, for unexpected
+    exceptions, has its traceback; tracebacks are only formatted for the
+    examples that are kept.
+
+    Reports from worker processes are combined with `merge`.
+    """
+
+    def __init__(self, samples=5):
+        self.samples = samples
+        self.entries = {}
+
+    def add(self, error, tag=None, where=None, with_traceback=False):
+        key = f"{type(error).__name__}:{tag or ''}"
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = self.entries[key] = {
+                "type": type(error).__name__,
+                "tag": tag,
+                "count": 0,
+                "examples": [],
+            }
+        entry["count"] += 1
+        if len(entry["examples"]) < self.samples:
+            example = {"message": str(error), "where": where}
+            if with_traceback:
+                example["traceback"] = "".join(traceback.format_exception(error))
+            entry["examples"].append(example)
+
+    def add_converter_errors(self, converter, where=None):
+        for error, tag in zip(converter.errors, converter.error_tags):
+            self.add(error, tag, where)
+
+    def total(self):
+        return sum(entry["count"] for entry in self.entries.values())
+
+    def take(self):
+        """
+        Return the summary so far and start afresh
+        """
+        summary = self.summary()
+        self.__init__(self.samples)
+        return summary
+
+    def merge(self, summary):
+        """
+        Add the `summary` of another report to this one
+        """
+        for key, other in summary["errors"].items():
+            entry = self.entries.get(key)
+            if entry is None:
+                entry = self.entries[key] = dict(other, count=0, examples=[])
+            entry["count"] += other["count"]
+            room = self.samples - len(entry["examples"])
+            entry["examples"].extend(other["examples"][:room])
+
+    def summary(self):
+        return {
+            "total": self.total(),
+            "errors": dict(
+                sorted(self.entries.items(), key=lambda item: -item[1]["count"])
+            ),
+        }
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.summary(), file, indent=2, ensure_ascii=False)
@@ -0,0 +1,117 @@
+import collections
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Bump when the shape of saved file lists changes
+FILE_LIST_VERSION = 1
+
+
+def xml_files(root_dir):
+    """
+    Yield the XML files in a directory and its subdirectories, in `os.walk` order
+    """
+    try:
+        entries = list(os.scandir(root_dir))
+    except OSError:
+        # like os.walk, skip directories that cannot be listed
+        return
+    subdirs = []
+    for entry in entries:
+        try:
+            is_dir = entry.is_dir()
+        except OSError:
+            is_dir = False
+        if is_dir:
+            # like os.walk, do not follow links to directories
+            if not entry.is_symlink():
+                subdirs.append(entry.path)
+        elif entry.name.endswith(".xml"):
+            yield entry.path
+    for subdir in subdirs:
+        yield from xml_files(subdir)
+
+
+def listed_xml_files(root_dirs, file_list=None, rescan=False):
+    """
+    The XML files under each of `root_dirs`, as a list of
+    `(root_dir, file_paths)`.
+
+    With a `file_list` path, the listing is saved there, and later calls
+    with the same root directories read it back instead of scanning them
+    again, unless `rescan`. A saved listing does not notice files added or
+    removed since it was made.
+    """
+    if file_list is not None and not rescan:
+        listing = load_file_list(file_list, root_dirs)
+        if listing is not None:
+            return listing
+    listing = [(root_dir, list(xml_files(root_dir))) for root_dir in root_dirs]
+    if file_list is not None:
+        save_file_list(file_list, listing)
+    return listing
+
+
+def load_file_list(path, root_dirs):
+    """
+    The listing saved at `path`, or None if there is none, or it is of
+    other root directories
+    """
+    try:
+        with open(path, encoding="utf-8") as file:
+            saved = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if saved.get("version") != FILE_LIST_VERSION:
+        return None
+    if saved.get("root_dirs") != list(root_dirs):
+        return None
+    return [(root_dir, files) for root_dir, files in saved["files"]]
+
+
+def save_file_list(path, listing):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(
+            {
+                "version": FILE_LIST_VERSION,
+                "root_dirs": [root_dir for root_dir, _ in listing],
+                "files": listing,
+            },
+            file,
+            ensure_ascii=False,
+        )
+    os.replace(tmp_path, path)
+
+
+def read_bytes(file_path):
+    """
+    The contents of a file, or None if it cannot be read
+    """
+    try:
+        with open(file_path, "rb") as file:
+            return file.read()
+    except OSError:
+        return None
+
+
+def prefetched(file_paths, threads=4, buffer=16):
+    """
+    Yield `(file_path, data)` for each of `file_paths`, in order, while
+    `threads` threads read up to `buffer` files ahead, so that reading
+    overlaps with whatever the consumer does with them.
+
+    `data` is the contents of the file, or None if it could not be read;
+    the consumer then reads it itself, and reports the error.
+    """
+    buffer = max(buffer, 1)
+    with ThreadPoolExecutor(threads) as executor:
+        pending = collections.deque()
+        for file_path in file_paths:
+            pending.append((file_path, executor.submit(read_bytes, file_path)))
+            if len(pending) >= buffer:
+                file_path, future = pending.popleft()
+                yield file_path, future.result()
+        while pending:
+            file_path, future = pending.popleft()
+            yield file_path, future.result()
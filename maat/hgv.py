@@ -0,0 +1,151 @@
+import functools
+import logging
+import os
+import sqlite3
+
+import lxml.etree as ET
+
+from maat.document import header_material, read_file, read_header
+
+
+class HGVIndex:
+    """
+    A persistent HGV id -> material table for an HGV_meta_EpiDoc folder.
+    Rows are keyed on the file's path within the folder, as `hgv_filename_from_idno`
+    computes it, so a lookup finds exactly the file a parse would have read.
+
+    The table lives in an SQLite file. `refresh` scans the folder and
+    re-parses only the files whose size or modification time changed since
+    the last scan, so an unchanged source is never parsed again. Lookups go
+    through an in-memory LRU cache.
+
+    Index objects can be pickled (the connection and cache are not), so one
+    can be handed to worker processes, which open their own connection.
+    """
+
+    def __init__(self, index_path, hgv_dir, cache_size=65536):
+        self.index_path = index_path
+        self.hgv_dir = os.path.abspath(hgv_dir)
+        self.cache_size = cache_size
+        self._connection = None
+        self._material = functools.lru_cache(maxsize=cache_size)(self._lookup)
+
+    def __getstate__(self):
+        return {
+            "index_path": self.index_path,
+            "hgv_dir": self.hgv_dir,
+            "cache_size": self.cache_size,
+        }
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.index_path)
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS hgv (
+                    path TEXT PRIMARY KEY,
+                    hgv_id TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    material TEXT NOT NULL
+                )
+                """
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS hgv_id_index ON hgv (hgv_id)"
+            )
+        return self._connection
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def covers(self, hgv_file):
+        """
+        Is `hgv_file` in the folder this index was built from?
+        """
+        folder = os.path.dirname(os.path.dirname(os.path.abspath(hgv_file)))
+        return folder == self.hgv_dir
+
+    def source_files(self):
+        """
+        Yield (relative path, size, mtime_ns) for each XML file in the folder
+        """
+        for root, dirs, files in os.walk(self.hgv_dir):
+            for file in files:
+                if file.endswith(".xml"):
+                    path = os.path.join(root, file)
+                    stat = os.stat(path)
+                    relative_path = os.path.relpath(path, self.hgv_dir)
+                    yield relative_path, stat.st_size, stat.st_mtime_ns
+
+    def refresh(self):
+        """
+        Bring the index up to date with the folder.
+        Return the number of files that were (re-)parsed.
+        """
+        connection = self.connection
+        known = {
+            path: (size, mtime_ns)
+            for path, size, mtime_ns in connection.execute(
+                "SELECT path, size, mtime_ns FROM hgv"
+            )
+        }
+        parsed = 0
+        with connection:
+            for relative_path, size, mtime_ns in self.source_files():
+                if known.pop(relative_path, None) == (size, mtime_ns):
+                    continue
+                connection.execute(
+                    "INSERT OR REPLACE INTO hgv VALUES (?, ?, ?, ?, ?)",
+                    (
+                        relative_path,
+                        os.path.basename(relative_path).removesuffix(".xml"),
+                        size,
+                        mtime_ns,
+                        self.parse_material(relative_path),
+                    ),
+                )
+                parsed += 1
+            # whatever is left over was deleted from the folder
+            connection.executemany(
+                "DELETE FROM hgv WHERE path = ?", [(path,) for path in known]
+            )
+        self._material.cache_clear()
+        return parsed
+
+    def parse_material(self, relative_path):
+        hgv_file = os.path.join(self.hgv_dir, relative_path)
+        try:
+            return header_material(read_header(read_file(hgv_file, what="hgv")), None)
+        except ET.ParseError:
+            logging.warning(f"Error parsing HGV file {hgv_file}")
+            return "unknown"
+
+    def _lookup(self, relative_path):
+        row = self.connection.execute(
+            "SELECT material FROM hgv WHERE path = ?", (relative_path,)
+        ).fetchone()
+        return row[0] if row is not None else None
+
+    def material(self, hgv_file):
+        """
+        The material recorded for `hgv_file` (see `hgv_filename_from_idno`),
+        or None if there is no such file
+        """
+        return self._material(os.path.relpath(hgv_file, self.hgv_dir))
+
+    def material_by_id(self, hgv_id):
+        """
+        The material recorded for an HGV id, or None if there is no such file
+        """
+        row = self.connection.execute(
+            "SELECT material FROM hgv WHERE hgv_id = ? ORDER BY path LIMIT 1",
+            (hgv_id,),
+        ).fetchone()
+        return row[0] if row is not None else None
@@ -0,0 +1,147 @@
+import hashlib
+
+from lingua import Language, LanguageDetectorBuilder
+
+from maat.document import reported_language
+
+
+lang_dict = {
+    str(Language.GREEK): "grc",
+    str(Language.LATIN): "la",
+    str(Language.ARABIC): "ara",
+}
+
+language_ids_to_keep = ["grc", "la", "cop"]
+# unfortunately, there are not enough ar texts to make a good evaluation
+
+# lingua has no Coptic model; Coptic texts are tagged with xml:lang="cop"
+default_candidates = ["GREEK", "LATIN", "ARABIC"]
+
+
+class LanguageDetector:
+    """
+    Guess the language of untagged text.
+
+    Only the `candidates` (lingua language names, or "all") are considered;
+    by default these are `default_candidates` plus whatever `lang_dict`
+    maps. The lingua detector is built the first time it is needed.
+    Results are memoized by a hash of the text, so repeated boilerplate is
+    only classified once; at most `memo_size` results are kept.
+    """
+
+    def __init__(self, candidates=None, memo_size=100_000):
+        if candidates is None:
+            candidates = default_candidates + [
+                key.removeprefix("Language.") for key in lang_dict
+            ]
+        self.candidates = candidates
+        self.memo_size = memo_size
+        self.memo = {}
+        self.hits = 0
+        self.misses = 0
+        self._detector = None
+
+    @property
+    def detector(self):
+        if self._detector is None:
+            if self.candidates == "all":
+                builder = LanguageDetectorBuilder.from_all_languages()
+            else:
+                languages = {
+                    getattr(Language, name.upper()) for name in self.candidates
+                }
+                builder = LanguageDetectorBuilder.from_languages(*languages)
+            self._detector = builder.build()
+        return self._detector
+
+    def language_id(self, detected):
+        lang = str(detected)
+        return lang_dict.get(lang, lang)
+
+    def remember(self, key, lang):
+        if len(self.memo) >= self.memo_size:
+            del self.memo[next(iter(self.memo))]
+        self.memo[key] = lang
+
+    def detect(self, text):
+        """
+        The language id of `text`, e.g. "grc"
+        """
+        return self.detect_many([text])[0]
+
+    def detect_many(self, texts):
+        """
+        The language ids of `texts`. Texts not seen before are classified
+        in a single call to lingua's parallel API.
+        """
+        keys = [hashlib.blake2b(text.encode("utf-8")).digest() for text in texts]
+        found = {}
+        unseen = {}
+        for key, text in zip(keys, texts):
+            if key in self.memo:
+                self.hits += 1
+                found[key] = self.memo[key]
+            elif key not in unseen:
+                unseen[key] = text
+        if unseen:
+            self.misses += len(unseen)
+            if len(unseen) == 1:
+                detected = [self.detector.detect_language_of(*unseen.values())]
+            else:
+                detected = self.detector.detect_languages_in_parallel_of(
+                    list(unseen.values())
+                )
+            for key, lang in zip(unseen, detected):
+                found[key] = self.language_id(lang)
+                self.remember(key, found[key])
+        return [found[key] for key in keys]
+
+
+def unknown_languages(names):
+    """
+    Those of `names` that are not lingua languages
+    """
+    return [
+        name
+        for name in names
+        if not isinstance(getattr(Language, name.upper(), None), Language)
+    ]
+
+
+def build_detector():
+    """
+    Build a language detector over the default candidate languages
+    """
+    return LanguageDetector()
+
+
+def languages(elements, detector, reported=None):
+    """
+    Return the reported language of each element, guessing the untagged
+    ones in a single batch. The reported languages can be passed in if
+    they are already known (see `maat.document.block_contexts`).
+    """
+    if reported is None:
+        langs = [reported_language(element) for element in elements]
+    else:
+        langs = list(reported)
+    untagged = [i for i, lang in enumerate(langs) if lang == "unknown"]
+    if untagged:
+        texts = ["".join(elements[i].itertext()) for i in untagged]
+        for i, lang in zip(untagged, detector.detect_many(texts)):
+            langs[i] = lang
+    return langs
+
+
+def language(element, detector):
+    """
+    Return the reported language, or guess"""
+    return languages([element], detector)[0]
+
+
+def language_filter(abs, detector):
+    return [
+        ab
+        for ab, lang in zip(abs, languages(abs, detector))
+        if lang in language_ids_to_keep
+    ]
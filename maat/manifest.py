@@ -0,0 +1,141 @@
+import hashlib
+import json
+import os
+
+from maat.converter import CONVERTER_VERSION
+from maat.pipeline import to_json
+
+
+def file_digest(path):
+    """
+    The SHA-256 hex digest of a file's content
+    """
+    with open(path, "rb") as file:
+        return hashlib.file_digest(file, "sha256").hexdigest()
+
+
+class Manifest:
+    """
+    What was converted, and from what.
+
+    For each input path the manifest keeps its size, modification time,
+    content hash, the converter version that converted it and the ids of
+    the records it produced. It is stored as a JSON file.
+
+    Only the input file itself is tracked: a change to an HGV metadata
+    file does not make the documents that use it stale.
+    """
+
+    def __init__(self, path, version=CONVERTER_VERSION):
+        self.path = path
+        self.version = version
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as file:
+                self.entries = json.load(file)["files"]
+        self._digests = {}
+
+    def paths(self):
+        return list(self.entries)
+
+    def is_current(self, path):
+        """
+        Was `path` converted, as it is now, by this converter version?
+        The content is only hashed when size or mtime have changed.
+        """
+        entry = self.entries.get(path)
+        if entry is None or entry["version"] != self.version:
+            return False
+        stat = os.stat(path)
+        if stat.st_size != entry["size"]:
+            return False
+        if stat.st_mtime_ns == entry["mtime_ns"]:
+            return True
+        digest = self._digests[path] = file_digest(path)
+        if digest != entry["sha256"]:
+            return False
+        # touched, but not changed
+        entry["mtime_ns"] = stat.st_mtime_ns
+        return True
+
+    def ids(self, path):
+        entry = self.entries.get(path)
+        return entry["ids"] if entry is not None else []
+
+    def update(self, path, ids):
+        stat = os.stat(path)
+        digest = self._digests.pop(path, None) or file_digest(path)
+        self.entries[path] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": digest,
+            "version": self.version,
+            "ids": ids,
+        }
+
+    def remove(self, path):
+        self.entries.pop(path, None)
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump({"files": self.entries}, file, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+def update_output(
+    file_paths, manifest, output_path, convert_batches, emit=None, scanned=None
+):
+    """
+    Bring the consolidated output at `output_path` up to date with `file_paths`.
+
+    Files that `manifest` knows to be current are skipped. New and changed
+    files are converted with `convert_batches` (see
+    `maat.pipeline.convert_file_batches`), and each of their JSON lines is
+    also passed to `emit`. The output is rewritten without the records of
+    changed or deleted files, followed by the new records, and then
+    atomically replaces the old one. Return a dict of file counts.
+
+    A file of the manifest missing from `file_paths` counts as deleted only
+    if `scanned(path)` says it would have been among them (by default, any
+    file), so that a run over some of the manifest's directories, or over
+    one shard, keeps the records of the others.
+    """
+    file_paths = list(file_paths)
+    present = set(file_paths)
+    if os.path.exists(output_path):
+        stale = [path for path in file_paths if not manifest.is_current(path)]
+    else:
+        stale = file_paths
+    deleted = [
+        path
+        for path in manifest.paths()
+        if path not in present and (scanned is None or scanned(path))
+    ]
+    dropped_ids = set()
+    for path in stale + deleted:
+        dropped_ids.update(manifest.ids(path))
+
+    tmp_path = output_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as out:
+        if os.path.exists(output_path):
+            with open(output_path, encoding="utf-8") as old:
+                for line in old:
+                    if json.loads(line)["id"] not in dropped_ids:
+                        out.write(line)
+        for path, records in convert_batches(stale):
+            for record in records:
+                line = to_json(record)
+                out.write(line + "\n")
+                if emit is not None:
+                    emit(line)
+            manifest.update(path, [record["id"] for record in records])
+    os.replace(tmp_path, output_path)
+    for path in deleted:
+        manifest.remove(path)
+    manifest.save()
+    return {
+        "unchanged": len(file_paths) - len(stale),
+        "converted": len(stale),
+        "deleted": len(deleted),
+    }
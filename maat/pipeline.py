@@ -0,0 +1,596 @@
+import contextlib
+import logging
+import logging.handlers
+import multiprocessing
+import time
+import lxml.etree as ET
+
+from maat.cache import BlockCache
+from maat.converter import Converter, content_training_text
+from maat.create import (
+    create_test_cases,
+    mask_spans,
+    materialize_test_case,
+)
+from maat.document import (
+    all_text,
+    edition_blocks,
+    file_bytes,
+    filepath_to_corpus_id,
+    header_metadata,
+    parse_bytes,
+    read_header,
+    record_parse_timings,
+    stream_abs,
+    take_parse_timings,
+)
+from maat.errors import ErrorReport
+from maat.files import prefetched, read_bytes, xml_files
+from maat.language import (
+    build_detector,
+    language,
+    language_ids_to_keep,
+    languages,
+)
+from maat.profile import Profile
+from maat.sinks import to_json_bytes
+from maat.stages import Stage, StagedRun
+from maat.stats import CorpusStats
+
+
+def kept_blocks(blocks, detector):
+    """
+    Filter `(ab, reported language)` pairs of edition blocks by language
+    and length, returning `(ab, language)` pairs with untagged blocks'
+    languages guessed
+    """
+    abs = [ab for ab, _ in blocks]
+    langs = languages(abs, detector, [lang for _, lang in blocks])
+    return [
+        (ab, lang)
+        for ab, lang in zip(abs, langs)
+        if lang in language_ids_to_keep and len(all_text(ab)) >= 10
+    ]
+
+
+def filtered_blocks(doc, detector):
+    """
+    The `(ab, language)` pairs of the edition blocks of `doc` that pass the
+    language and length filters. Only the edition `div`s are walked (see
+    `edition_blocks`).
+    """
+    return kept_blocks(list(edition_blocks(doc)), detector)
+
+
+def filtered_abs(doc, detector):
+    return [ab for ab, _ in filtered_blocks(doc, detector)]
+
+
+def to_json(record):
+    """
+    Serialize a record as a single JSON line (without the newline)
+    """
+    return to_json_bytes(record).decode("utf-8")
+
+
+# How records carry their test cases: every case written out in full, or
+# only the spans of the training text each case masks
+TEST_CASE_MODES = ["full", "spans"]
+
+
+def full_test_cases(record):
+    """
+    The test cases of a record, in the "full" shape, whichever mode it was
+    written in
+    """
+    if "test_cases" in record:
+        return record["test_cases"]
+    plain_text = record["training_text"].replace("[", "").replace("]", "")
+    return [
+        {
+            "case_index": c_index + 1,
+            "id": f"{record['id']}/{c_index + 1}",
+            "test_case": materialize_test_case(plain_text, span),
+        }
+        for c_index, span in enumerate(record["test_case_spans"])
+    ]
+
+
+def no_stage(name):
+    """
+    The `Profile.stage` of a pipeline that is not profiled
+    """
+    return NO_STAGE
+
+
+NO_STAGE = contextlib.nullcontext()
+
+
+class Pipeline:
+    """
+    Convert TEI files into MAAT records.
+
+    A pipeline owns its converter and language detector, so they are built
+    once and reused for every file it processes. With `streaming`, files are
+    read with `stream_abs` instead of being parsed into a full tree. With an
+    `hgv_index` (see `maat.hgv.HGVIndex`), materials missing from a document
+    are looked up in the index instead of parsing its HGV file. `engine`
+    selects the `Converter` engine. `test_cases` is one of `TEST_CASE_MODES`;
+    with "spans", a record has a `test_case_spans` list instead of
+    `test_cases` (see `full_test_cases`). With a `profile` (see
+    `maat.profile.Profile`), the time spent in each stage and converter
+    handler is recorded in it. Errors are counted in `error_report` (see
+    `maat.errors.ErrorReport`), or in a report of the pipeline's own. With
+    a `block_cache` (see `maat.cache.BlockCache`), blocks converted before
+    are not converted again. With `stats` (see `maat.stats.CorpusStats`),
+    the statistics of the records are gathered in it.
+    """
+
+    def __init__(
+        self,
+        detector=None,
+        streaming=False,
+        hgv_index=None,
+        engine="recursive",
+        test_cases="full",
+        profile=None,
+        error_report=None,
+        block_cache=None,
+        stats=None,
+    ):
+        if test_cases not in TEST_CASE_MODES:
+            raise ValueError(
+                f"Unknown test case mode {test_cases}; must be one of {TEST_CASE_MODES}"
+            )
+        self.detector = detector if detector is not None else build_detector()
+        self.converter = Converter(engine=engine)
+        self.streaming = streaming
+        self.hgv_index = hgv_index
+        self.test_cases = test_cases
+        self.profile = profile
+        self.error_report = error_report if error_report is not None else ErrorReport()
+        self.block_cache = block_cache
+        self.stats = stats
+        if profile is None:
+            self.stage = no_stage
+        else:
+            self.stage = profile.stage
+            record_parse_timings()
+            profile.instrument_converter(self.converter)
+            self.detector.detect_many = profile.timed(
+                "language", self.detector.detect_many
+            )
+
+    def process(self, file_path, data=None):
+        """
+        Yield a record for each edition block of the file. If the file has
+        already been read (see `maat.files.prefetched`), its contents can be
+        given as `data` bytes.
+        """
+        if self.streaming:
+            yield from self.process_streamed(file_path, data)
+        else:
+            yield from self.process_parsed(file_path, data)
+
+    def process_parsed(self, file_path, data=None):
+        try:
+            # parsing is timed by `parse_bytes` itself
+            with self.stage("read"):
+                if data is None:
+                    data = file_bytes(file_path)
+            doc = parse_bytes(data)
+        except ET.XMLSyntaxError as e:
+            logging.error(f"Error parsing {file_path}. Error: {e}\n")
+            self.error_report.add(e, where=file_path)
+            return
+        except ET.ParseError as e:
+            logging.error(f"Error parsing {file_path}. Error: {e}\n")
+            self.error_report.add(e, where=file_path)
+            return
+        except FileNotFoundError as e:
+            logging.error(f"File not found: {file_path}\n")
+            self.error_report.add(e, where=file_path)
+            return
+        with self.stage("header"):
+            metadata = self.metadata(file_path, read_header(doc))
+        with self.stage("filter"):
+            blocks = filtered_blocks(doc, self.detector)
+        for ab_index, (ab, lang) in enumerate(blocks):
+            record = self.record(file_path, metadata, ab_index, ab, lang)
+            if record is not None:
+                yield record
+
+    def process_streamed(self, file_path, data=None):
+        metadata = None
+        ab_index = 0
+        try:
+            for header, ab, lang in stream_abs(file_path, data):
+                with self.stage("filter"):
+                    kept = kept_blocks([(ab, lang)], self.detector)
+                if not kept:
+                    continue
+                lang = kept[0][1]
+                if metadata is None:
+                    with self.stage("header"):
+                        metadata = self.metadata(file_path, header)
+                record = self.record(file_path, metadata, ab_index, ab, lang)
+                ab_index += 1
+                if record is not None:
+                    yield record
+        except ET.XMLSyntaxError as e:
+            logging.error(f"Error parsing {file_path}. Error: {e}\n")
+            self.error_report.add(e, where=file_path)
+        except ET.ParseError as e:
+            logging.error(f"Error parsing {file_path}. Error: {e}\n")
+            self.error_report.add(e, where=file_path)
+        except FileNotFoundError as e:
+            logging.error(f"File not found: {file_path}\n")
+            self.error_report.add(e, where=file_path)
+
+    def metadata(self, file_path, header):
+        """
+        The `(corpus_id, file_id, title, material)` of a file, from its
+        header fields
+        """
+        fields = header_metadata(header, file_path, self.hgv_index)
+        return (
+            filepath_to_corpus_id(file_path),
+            fields["idno"],
+            fields["title"],
+            fields["material"].lower(),
+        )
+
+    def record(self, file_path, metadata, ab_index, ab, lang=None):
+        """
+        Convert one block to a record, or None if the conversion failed.
+        `lang` is the block's language, if it is already known.
+        """
+        _corpus_id, _file_id, _title, _material = metadata
+        _lang = lang if lang is not None else language(ab, self.detector)
+        training_text = self.training_text(ab, f"{file_path} {ab_index}")
+        if training_text is None:
+            return None
+
+        d = {}
+        d["corpus_id"] = _corpus_id
+        d["file_id"] = _file_id
+        d["block_index"] = ab_index + 1
+        id = f"{_corpus_id}/{_file_id}/{ab_index + 1}"
+        d["id"] = id
+        d["title"] = _title
+        d["material"] = _material
+        d["language"] = _lang
+        d["training_text"] = training_text
+        with self.stage("test_cases"):
+            self.add_test_cases(d)
+        if self.stats is not None:
+            with self.stage("stats"):
+                self.stats.add_tags(ab)
+                self.stats.add(d)
+        return d
+
+    def training_text(self, ab, where):
+        """
+        The training text of a block, from the block cache if it has it, or
+        None if the conversion failed. `where` locates the block in errors.
+        """
+        cache = self.block_cache
+        if cache is None:
+            return self.convert_block(ab, where)
+        with self.stage("cache"):
+            key = cache.key(ab)
+            cached = cache.get(key)
+        if cached is not None:
+            training_text, errors = cached
+            for error, tag in errors:
+                self.error_report.add(error, tag, where)
+            return training_text
+        training_text = self.convert_block(ab, where)
+        if training_text is not None:
+            converter = self.converter
+            cache.put(key, training_text, zip(converter.errors, converter.error_tags))
+        return training_text
+
+    def convert_block(self, ab, where):
+        converter = self.converter
+        converter.reset()
+        try:
+            with self.stage("convert"):
+                content = converter.content(ab)
+        except Exception as e:
+            logging.error(f"Some other error converting {where} {e}")
+            self.error_report.add(e, where=where, with_traceback=True)
+            return None
+        finally:
+            if converter.errors:
+                self.error_report.add_converter_errors(converter, where)
+        try:
+            with self.stage("training_text"):
+                return content_training_text(content)
+        except Exception as e:
+            logging.error(f"Error creating training text {where} {e}")
+            self.error_report.add(e, where=where, with_traceback=True)
+            return None
+
+    def add_test_cases(self, d):
+        """
+        Add the test cases of record `d`, made from its training text
+        """
+        if self.test_cases == "spans":
+            d["test_case_spans"] = mask_spans(d["training_text"])[1]
+            return
+        d["test_cases"] = []
+        cases = create_test_cases(d["training_text"])
+        for c_index, c in enumerate(cases):
+            cd = {}
+            cd["case_index"] = c_index + 1
+            cd["id"] = f"{d['id']}/{c_index + 1}"
+            cd["test_case"] = c
+            d["test_cases"].append(cd)
+
+    def process_all(self, file_path, data=None):
+        if self.profile is None:
+            return list(self.process(file_path, data))
+        wall = time.perf_counter()
+        records = list(self.process(file_path, data))
+        self.profile.file(file_path, time.perf_counter() - wall)
+        self.profile.add_stages(take_parse_timings())
+        return records
+
+
+def queue_handler(log_queue):
+    """
+    A logging handler passing records on to `log_queue`, to be written by
+    a `logging.handlers.QueueListener`
+    """
+    handler = logging.handlers.QueueHandler(log_queue)
+    # records are formatted by the listener's handlers, not on the way in
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    return handler
+
+
+# Each worker process keeps one pipeline for its whole life
+_worker_pipeline = None
+
+
+def _init_worker(detector_factory, options, log_queue=None):
+    global _worker_pipeline
+    if log_queue is not None:
+        # a worker started by spawn or forkserver, rather than fork, does not
+        # inherit the parent's logging set-up
+        logging.getLogger().handlers = [queue_handler(log_queue)]
+    # each worker profiles itself, reports its own errors, counts its own
+    # cache hits and gathers its own stats; `_process_in_worker` sends them back
+    if options.get("profile") is not None:
+        options = dict(options, profile=Profile(options["profile"].slowest))
+    if options.get("error_report") is not None:
+        options = dict(
+            options, error_report=ErrorReport(options["error_report"].samples)
+        )
+    if options.get("block_cache") is not None:
+        # not the parent's connection, which forked workers would inherit
+        block_cache = options["block_cache"]
+        options = dict(options, block_cache=BlockCache(**block_cache.__getstate__()))
+    if options.get("stats") is not None:
+        options = dict(options, stats=CorpusStats())
+    _worker_pipeline = Pipeline(detector_factory(), **options)
+
+
+def _process_in_worker(file_path, data=None):
+    records = _worker_pipeline.process_all(file_path, data)
+    profile = _worker_pipeline.profile
+    block_cache = _worker_pipeline.block_cache
+    stats = _worker_pipeline.stats
+    if block_cache is not None:
+        # workers are terminated without notice, so write as we go
+        block_cache.flush()
+    return (
+        file_path,
+        records,
+        profile.take() if profile is not None else None,
+        _worker_pipeline.error_report.take(),
+        block_cache.take() if block_cache is not None else None,
+        stats.take() if stats is not None else None,
+    )
+
+
+def _process_chunk_in_worker(task):
+    # read the whole chunk ahead while its first files are being converted
+    file_paths, prefetch = task
+    return [
+        _process_in_worker(file_path, data)
+        for file_path, data in prefetched(file_paths, prefetch, len(file_paths))
+    ]
+
+
+def chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def convert_file_batches(
+    file_paths,
+    workers=1,
+    chunksize=8,
+    ordered=True,
+    detector_factory=build_detector,
+    prefetch=0,
+    prefetch_buffer=16,
+    staged=False,
+    queue_size=16,
+    log_queue=None,
+    **options,
+):
+    """
+    Convert files, yielding `(file_path, records)` for each file.
+
+    With more than one worker, files are handed out to a process pool in
+    chunks of `chunksize`, and each worker builds its own pipeline (and
+    detector, via `detector_factory`) once. If `ordered`, files come back
+    in input order, exactly as a serial run would produce them; otherwise
+    each file is yielded as soon as it is finished.
+
+    With `prefetch` threads, files are read ahead of the parser, so that
+    waiting for slow (e.g. network) storage overlaps with conversion: up to
+    `prefetch_buffer` files ahead in a serial run, and a whole chunk ahead
+    in each worker. If `staged`, the run is a `maat.stages.StagedRun`
+    instead (see `staged_file_batches`). Workers log to `log_queue`, if
+    given (see `queue_handler`). Other keyword
+    `options` (`streaming`, `hgv_index`, `engine`, `test_cases`, `profile`,
+    `error_report`, `block_cache`, `stats`) are passed on to each
+    `Pipeline`; the workers' profiles, error reports, cache stats and
+    corpus stats are merged into `profile`, `error_report`, `block_cache`
+    and `stats`.
+    """
+    if staged:
+        yield from staged_file_batches(
+            file_paths,
+            workers,
+            ordered,
+            detector_factory,
+            max(prefetch, 1),
+            queue_size,
+            log_queue,
+            **options,
+        )
+        return
+    if workers <= 1:
+        pipeline = Pipeline(detector_factory(), **options)
+        if prefetch:
+            files = prefetched(file_paths, prefetch, prefetch_buffer)
+        else:
+            files = ((file_path, None) for file_path in file_paths)
+        try:
+            for file_path, data in files:
+                yield file_path, pipeline.process_all(file_path, data)
+        finally:
+            if pipeline.block_cache is not None:
+                pipeline.block_cache.flush()
+        return
+    with multiprocessing.Pool(
+        workers,
+        initializer=_init_worker,
+        initargs=(detector_factory, options, log_queue),
+    ) as pool:
+        imap = pool.imap if ordered else pool.imap_unordered
+        if prefetch:
+            tasks = ((chunk, prefetch) for chunk in chunks(file_paths, chunksize))
+            results = (
+                result
+                for chunk_results in imap(_process_chunk_in_worker, tasks)
+                for result in chunk_results
+            )
+        else:
+            results = imap(_process_in_worker, file_paths, chunksize)
+        yield from merged_worker_results(results, options)
+
+
+def merged_worker_results(results, options):
+    """
+    Yield `(file_path, records)` from the results of `_process_in_worker`,
+    merging what the workers recorded into the run's `options`
+    """
+    profile = options.get("profile")
+    error_report = options.get("error_report")
+    block_cache = options.get("block_cache")
+    stats = options.get("stats")
+    for (
+        file_path,
+        records,
+        profile_summary,
+        error_summary,
+        cache_stats,
+        stats_summary,
+    ) in results:
+        if profile_summary is not None:
+            profile.merge(profile_summary)
+        if error_summary is not None and error_report is not None:
+            error_report.merge(error_summary)
+        if cache_stats is not None:
+            block_cache.merge(cache_stats)
+        if stats_summary is not None:
+            stats.merge(stats_summary)
+        yield file_path, records
+
+
+def staged_file_batches(
+    file_paths,
+    workers=1,
+    ordered=True,
+    detector_factory=build_detector,
+    readers=4,
+    queue_size=16,
+    log_queue=None,
+    **options,
+):
+    """
+    Convert files like `convert_file_batches`, as a `maat.stages.StagedRun`
+    of two stages: "read", where `readers` threads read files, and
+    "convert", where `workers` processes (or, with one worker, a thread)
+    parse and convert them. Whoever consumes the results is the third.
+    Each stage's queue holds up to `queue_size` files, so a slow stage
+    holds back the ones before it. Parsing, the header, language detection
+    and conversion stay in one stage, as the parsed tree cannot be handed
+    between processes.
+
+    With a `profile`, the stages' report is kept in its `queues`.
+    """
+
+    def read(file_path):
+        return file_path, read_bytes(file_path)
+
+    pool = None
+    if workers > 1:
+        pool = multiprocessing.Pool(
+            workers,
+            initializer=_init_worker,
+            initargs=(detector_factory, options, log_queue),
+        )
+
+        def convert(item):
+            return pool.apply(_process_in_worker, item)
+
+    else:
+        pipelines = []
+
+        def convert(item):
+            # built in the stage's thread, which its database connections
+            # (block cache, HGV index) then belong to
+            if not pipelines:
+                pipelines.append(Pipeline(detector_factory(), **options))
+            pipeline = pipelines[0]
+            file_path, data = item
+            records = pipeline.process_all(file_path, data)
+            if pipeline.block_cache is not None:
+                pipeline.block_cache.flush()
+            return file_path, records, None, None, None, None
+
+    run = StagedRun(
+        [
+            Stage("read", read, readers, queue_size),
+            Stage("convert", convert, workers, queue_size),
+        ],
+        ordered=ordered,
+    )
+    try:
+        yield from merged_worker_results(run.run(file_paths), options)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        if options.get("profile") is not None:
+            options["profile"].queues = run.report()
+
+
+def convert_files(file_paths, **kwargs):
+    """
+    Convert files to records; see `convert_file_batches` for the options
+    """
+    for _, records in convert_file_batches(file_paths, **kwargs):
+        yield from records
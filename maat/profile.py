@@ -0,0 +1,176 @@
+import contextlib
+import functools
+import heapq
+import json
+import time
+from collections import Counter
+
+from maat.utils import tag_localname
+
+
+def new_timing():
+    return {"calls": 0, "wall": 0.0, "cpu": 0.0}
+
+
+def add_timing(timings, name, calls, wall, cpu):
+    timing = timings.get(name)
+    if timing is None:
+        timing = timings[name] = new_timing()
+    timing["calls"] += calls
+    timing["wall"] += wall
+    timing["cpu"] += cpu
+    return timing
+
+
+class Profile:
+    """
+    Where the time of a run went.
+
+    Wall and CPU time are recorded per pipeline stage (see `stage`) and per
+    converter handler (see `instrument_converter`), together with the number
+    of elements converted per tag and the `slowest` slowest files. Handler
+    times include the handlers they call; `self_wall` excludes them. With
+    the iterative engine, handler times are those of the plans, which do
+    not convert the children.
+
+    Profiles from worker processes are combined with `merge`.
+    """
+
+    def __init__(self, slowest=20):
+        self.slowest = slowest
+        self.stages = {}
+        self.handlers = {}
+        self.tags = Counter()
+        self.files = []
+        # how full the queues of a staged run were (see `maat.stages`)
+        self.queues = {}
+        # hits, misses, writes and evictions of the block cache (see `maat.cache`)
+        self.block_cache = {}
+        # wall time spent in the handlers called by each running handler
+        self._nested = []
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            add_timing(
+                self.stages,
+                name,
+                1,
+                time.perf_counter() - wall,
+                time.process_time() - cpu,
+            )
+
+    def timed(self, name, func):
+        """
+        `func`, with its calls recorded as stage `name`
+        """
+
+        @functools.wraps(func)
+        def timed_func(*args, **kwargs):
+            with self.stage(name):
+                return func(*args, **kwargs)
+
+        return timed_func
+
+    def timed_handler(self, name, func, count=True):
+        """
+        Handler `func(converter, element, ...)`, with its calls recorded,
+        and, if `count`, the tags of the elements it converts
+        """
+
+        def handler(converter, element, *args):
+            if count:
+                self.tags[tag_localname(element)] += 1
+            self._nested.append(0.0)
+            wall = time.perf_counter()
+            cpu = time.process_time()
+            try:
+                return func(converter, element, *args)
+            finally:
+                wall = time.perf_counter() - wall
+                cpu = time.process_time() - cpu
+                nested = self._nested.pop()
+                if self._nested:
+                    self._nested[-1] += wall
+                timing = add_timing(self.handlers, name, 1, wall, cpu)
+                timing["self_wall"] = timing.get("self_wall", 0.0) + wall - nested
+
+        return handler
+
+    def instrument_converter(self, converter):
+        """
+        Time the handlers (and plans) of one converter, by giving it its own
+        timed copies of its class's tables
+        """
+        converter.tag_handlers = {
+            key: self.timed_handler(func.__name__, func)
+            for key, func in converter.tag_handlers.items()
+        }
+        converter.tag_plans = {
+            key: self.timed_handler(func.__name__, func)
+            for key, func in converter.tag_plans.items()
+        }
+        method = type(converter).text_from_acceptable_children
+        converter.text_from_acceptable_children = functools.partial(
+            self.timed_handler(method.__name__, method, count=False), converter
+        )
+
+    def add_stages(self, stages):
+        """
+        Add stage timings, as `{name: {"calls", "wall", "cpu"}}`, recorded
+        elsewhere (see `maat.document.take_parse_timings`)
+        """
+        for name, timing in stages.items():
+            add_timing(self.stages, name, **timing)
+
+    def file(self, path, wall):
+        entry = (wall, path)
+        if len(self.files) < self.slowest:
+            heapq.heappush(self.files, entry)
+        else:
+            heapq.heappushpop(self.files, entry)
+
+    def take(self):
+        """
+        Return the summary so far and start afresh
+        """
+        summary = self.summary()
+        self.__init__(self.slowest)
+        return summary
+
+    def merge(self, summary):
+        """
+        Add the `summary` of another profile to this one
+        """
+        self.add_stages(summary["stages"])
+        for name, timing in summary["handlers"].items():
+            timing = dict(timing)
+            self_wall = timing.pop("self_wall", 0.0)
+            total = add_timing(self.handlers, name, **timing)
+            total["self_wall"] = total.get("self_wall", 0.0) + self_wall
+        self.tags.update(summary["tags"])
+        for entry in summary["slowest_files"]:
+            self.file(entry["path"], entry["wall"])
+
+    def summary(self):
+        return {
+            "stages": self.stages,
+            "handlers": dict(
+                sorted(self.handlers.items(), key=lambda item: -item[1]["wall"])
+            ),
+            "tags": dict(self.tags.most_common()),
+            "slowest_files": [
+                {"path": path, "wall": wall}
+                for wall, path in sorted(self.files, reverse=True)
+            ],
+            "queues": self.queues,
+            "block_cache": self.block_cache,
+        }
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.summary(), file, indent=2, ensure_ascii=False)
@@ -0,0 +1,259 @@
+import json
+import mmap
+import os
+import random
+import sqlite3
+
+from maat.pipeline import full_test_cases
+
+# Bump when the layout of record indexes changes
+INDEX_VERSION = 1
+
+
+def index_path_for(path):
+    """
+    Where the index of a JSON lines file is kept by default: next to it
+    """
+    return path + ".idx"
+
+
+class RecordIndex:
+    """
+    A sidecar index of a JSON lines file of records: the byte offset and
+    length of each record's line, by id, with its `corpus_id` and
+    `language`. It is an SQLite file, written `batch_size` entries at a
+    time; `finish` records the size of the indexed file, so that a reader
+    can tell when the file has changed since.
+
+    Opening an index for writing empties it.
+    """
+
+    def __init__(self, path, batch_size=10000):
+        self.path = path
+        self.batch_size = batch_size
+        self.pending = []
+        self.connection = sqlite3.connect(path)
+        with self.connection:
+            self.connection.execute("DROP TABLE IF EXISTS records")
+            self.connection.execute("DROP TABLE IF EXISTS meta")
+            self.connection.execute(
+                """
+                CREATE TABLE records (
+                    id TEXT PRIMARY KEY,
+                    corpus_id TEXT,
+                    language TEXT,
+                    offset INTEGER NOT NULL,
+                    length INTEGER NOT NULL
+                )
+                """
+            )
+            self.connection.execute(
+                "CREATE TABLE meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+            )
+
+    def add(self, record, offset, length):
+        """
+        Index `record`, whose line starts at `offset` and is `length` bytes
+        long (without the newline). A later record with the same id
+        replaces it.
+        """
+        self.pending.append(
+            (
+                record["id"],
+                record.get("corpus_id"),
+                record.get("language"),
+                offset,
+                length,
+            )
+        )
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?)", self.pending
+            )
+        self.pending = []
+
+    def finish(self, size):
+        """
+        Write the last entries, and the size of the indexed file
+        """
+        self.flush()
+        with self.connection:
+            self.connection.execute(
+                "CREATE INDEX records_corpus_id ON records (corpus_id, offset)"
+            )
+            self.connection.execute(
+                "CREATE INDEX records_language ON records (language, offset)"
+            )
+            self.connection.executemany(
+                "INSERT INTO meta VALUES (?, ?)",
+                [("version", INDEX_VERSION), ("size", size)],
+            )
+        self.connection.close()
+
+
+def build_index(path, index_path=None):
+    """
+    Index the JSON lines file at `path`, in `index_path` (by default,
+    `index_path_for(path)`). Return the number of records indexed.
+    """
+    if index_path is None:
+        index_path = index_path_for(path)
+    index = RecordIndex(index_path)
+    offset = 0
+    count = 0
+    with open(path, "rb") as file:
+        for line in file:
+            content = line.rstrip(b"\n")
+            if content.strip():
+                index.add(json.loads(content), offset, len(content))
+                count += 1
+            offset += len(line)
+    index.finish(offset)
+    return count
+
+
+class RecordReader:
+    """
+    Random access to a JSON lines file of records, through its index (see
+    `RecordIndex`, `build_index`), without reading the whole file: the file
+    is memory-mapped, and only the lines asked for are parsed.
+
+    Records are looked up by id with `get` (or `reader[id]`); the id of a
+    test case (`<record id>/<case index>`) gives that case, in the "full"
+    shape. `records` scans the records of a corpus, of a language or with
+    an id prefix, in file order, and `sample` draws some at random.
+
+    An index of another version, or made when the file had another size,
+    is refused: rebuild it with `build_index`.
+    """
+
+    def __init__(self, path, index_path=None):
+        if index_path is None:
+            index_path = index_path_for(path)
+        if not os.path.exists(index_path):
+            raise FileNotFoundError(f"No index {index_path}; build it with build_index")
+        self.path = path
+        self.connection = sqlite3.connect(f"file:{index_path}?mode=ro", uri=True)
+        meta = dict(self.connection.execute("SELECT key, value FROM meta"))
+        if meta.get("version") != INDEX_VERSION:
+            self.connection.close()
+            raise ValueError(f"{index_path} is not a version {INDEX_VERSION} index")
+        self.file = open(path, "rb")
+        size = os.fstat(self.file.fileno()).st_size
+        if meta.get("size") != size:
+            self.close()
+            raise ValueError(f"{index_path} is out of date with {path}")
+        # an empty file cannot be mapped, and has nothing to read anyway
+        self.data = (
+            mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        )
+
+    def close(self):
+        if isinstance(getattr(self, "data", None), mmap.mmap):
+            self.data.close()
+        self.file.close()
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    def __contains__(self, id):
+        return self.get(id) is not None
+
+    def __getitem__(self, id):
+        found = self.get(id)
+        if found is None:
+            raise KeyError(id)
+        return found
+
+    def read(self, offset, length):
+        return json.loads(self.data[offset : offset + length])
+
+    def locate(self, id):
+        return self.connection.execute(
+            "SELECT offset, length FROM records WHERE id = ?", (id,)
+        ).fetchone()
+
+    def get(self, id):
+        """
+        The record with this id, or the test case with this id, or None
+        """
+        location = self.locate(id)
+        if location is not None:
+            return self.read(*location)
+        record_id, _, case_index = id.rpartition("/")
+        if not case_index.isdigit():
+            return None
+        location = self.locate(record_id)
+        if location is None:
+            return None
+        for case in full_test_cases(self.read(*location)):
+            if case["id"] == id:
+                return case
+        return None
+
+    def where(self, corpus_id=None, language=None, prefix=None):
+        conditions = []
+        parameters = []
+        if corpus_id is not None:
+            conditions.append("corpus_id = ?")
+            parameters.append(corpus_id)
+        if language is not None:
+            conditions.append("language = ?")
+            parameters.append(language)
+        if prefix is not None:
+            # a range of the primary key, rather than LIKE, which has wildcards
+            conditions.append("id >= ? AND id < ?")
+            parameters.extend([prefix, prefix + "\U0010ffff"])
+        if not conditions:
+            return "", parameters
+        return " WHERE " + " AND ".join(conditions), parameters
+
+    def records(self, corpus_id=None, language=None, prefix=None):
+        """
+        Yield the records of `corpus_id`, in `language` and whose id starts
+        with `prefix` (any of which can be left out), in file order
+        """
+        where, parameters = self.where(corpus_id, language, prefix)
+        for offset, length in self.connection.execute(
+            f"SELECT offset, length FROM records{where} ORDER BY offset", parameters
+        ):
+            yield self.read(offset, length)
+
+    def sample(self, k, seed=None, corpus_id=None, language=None):
+        """
+        `k` records drawn at random (all of them, if there are fewer) from
+        those of `corpus_id` and in `language`, the same ones for the same
+        `seed`
+        """
+        where, parameters = self.where(corpus_id, language)
+        (count,) = self.connection.execute(
+            f"SELECT COUNT(*) FROM records{where}", parameters
+        ).fetchone()
+        rng = random.Random(seed)
+        # which of the matching records, by position, without listing them all
+        positions = set(rng.sample(range(count), min(k, count)))
+        chosen = [
+            location
+            for position, location in enumerate(
+                self.connection.execute(
+                    f"SELECT offset, length FROM records{where} ORDER BY offset",
+                    parameters,
+                )
+            )
+            if position in positions
+        ]
+        rng.shuffle(chosen)
+        return [self.read(offset, length) for offset, length in chosen]
@@ -0,0 +1,180 @@
+import hashlib
+import heapq
+import json
+import os
+import tempfile
+
+
+def shard_key(file_path, root_dir):
+    """
+    The path of a file as it is hashed for sharding: relative to the
+    parent of its root directory, with "/" separators, so it is the same
+    wherever the corpus is checked out
+    """
+    root_dir = os.path.abspath(root_dir)
+    relative_path = os.path.relpath(os.path.abspath(file_path), root_dir)
+    key = os.path.join(os.path.basename(root_dir), relative_path)
+    return key.replace(os.sep, "/")
+
+
+def shard_of(key, shards):
+    """
+    The shard, from 1 to `shards`, of a `shard_key`
+    """
+    digest = hashlib.sha256(key.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % shards + 1
+
+
+def parse_shard(text):
+    """
+    Parse "i/N" into (i, N), with 1 <= i <= N
+    >>> parse_shard("2/4")
+    (2, 4)
+    """
+    index, shards = (int(part) for part in text.split("/"))
+    if not 1 <= index <= shards:
+        raise ValueError(f"Shard {text} must be i/N with 1 <= i <= N")
+    return index, shards
+
+
+def parse_shard_path(text):
+    """
+    Parse "i/N=path", a shard output and the shard it is, into
+    ((i, N), path)
+    >>> parse_shard_path("2/4=maat.2.jsonl")
+    ((2, 4), 'maat.2.jsonl')
+    """
+    shard, separator, path = text.partition("=")
+    if not separator or not path:
+        raise ValueError(f"{text} must be i/N=path")
+    return parse_shard(shard), path
+
+
+def shard_files(file_paths, root_dir, index, shards):
+    """
+    The files among `file_paths` (all under `root_dir`) in shard `index`
+    """
+    for file_path in file_paths:
+        if shard_of(shard_key(file_path, root_dir), shards) == index:
+            yield file_path
+
+
+# Merging shard outputs
+
+
+def sorted_runs(path, run_size, directory):
+    """
+    Split the JSON lines file `path` into files of at most `run_size` lines,
+    each sorted by record id. Each line of a run is the JSON-encoded id, a
+    tab, and the record's line. Return the paths of the runs.
+    """
+    runs = []
+
+    def write_run(lines):
+        lines.sort()
+        fd, run_path = tempfile.mkstemp(suffix=".run", dir=directory)
+        with os.fdopen(fd, "w", encoding="utf-8") as run:
+            run.writelines(
+                f"{json.dumps(id, ensure_ascii=False)}\t{line}" for id, line in lines
+            )
+        runs.append(run_path)
+
+    lines = []
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            if not line.strip():
+                continue
+            if not line.endswith("\n"):
+                line += "\n"
+            lines.append((json.loads(line)["id"], line))
+            if len(lines) >= run_size:
+                write_run(lines)
+                lines = []
+    if lines:
+        write_run(lines)
+    return runs
+
+
+def read_run(run_path):
+    with open(run_path, encoding="utf-8") as run:
+        for entry in run:
+            key, line = entry.split("\t", 1)
+            yield json.loads(key), line
+
+
+class MergeCheck:
+    """
+    What is wrong with a merged output: ids that occur more than once,
+    and, given the `(i, N)` of each merged shard, shards of the N that are
+    missing or merged twice. At most `samples` duplicate ids are kept.
+    The merge sorts the records, so their order needs no checking.
+
+    Block indexes are not checked: a block that fails to convert keeps its
+    index, so a file's blocks can have gaps in a complete output.
+    """
+
+    def __init__(self, shards=None, samples=20):
+        self.samples = samples
+        self.shards = shards
+        self.records = 0
+        self.duplicate_count = 0
+        self.duplicates = []
+        self.previous_id = None
+
+    def add(self, id):
+        self.records += 1
+        if id == self.previous_id:
+            self.duplicate_count += 1
+            if len(self.duplicates) < self.samples:
+                self.duplicates.append(id)
+        self.previous_id = id
+
+    def shard_problems(self):
+        """
+        The shards missing from 1..N, those given more than once, and
+        whether the shards disagree on N
+        """
+        if not self.shards:
+            return [], [], False
+        totals = {total for _, total in self.shards}
+        total = max(totals)
+        counts = {}
+        for index, _ in self.shards:
+            counts[index] = counts.get(index, 0) + 1
+        missing = [index for index in range(1, total + 1) if index not in counts]
+        repeated = sorted(index for index, count in counts.items() if count > 1)
+        return missing, repeated, len(totals) > 1
+
+    def summary(self):
+        missing, repeated, mixed = self.shard_problems()
+        return {
+            "records": self.records,
+            "duplicate_ids": self.duplicate_count,
+            "duplicate_examples": self.duplicates,
+            "missing_shards": missing,
+            "repeated_shards": repeated,
+            "mixed_shard_counts": mixed,
+            "ok": not (self.duplicate_count or missing or repeated or mixed),
+        }
+
+
+def merge_shards(paths, output_path, run_size=100_000, shards=None):
+    """
+    Merge the JSON lines files `paths` into `output_path`, sorted by id,
+    holding at most `run_size` records per input in memory at a time, and
+    check the result (see `MergeCheck`), given the `(i, N)` `shards` the
+    files are. Return the check's summary.
+    """
+    check = MergeCheck(shards)
+    directory = os.path.dirname(os.path.abspath(output_path))
+    with tempfile.TemporaryDirectory(dir=directory) as run_directory:
+        runs = []
+        for path in paths:
+            runs.extend(sorted_runs(path, run_size, run_directory))
+        tmp_path = output_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as out:
+            for id, line in heapq.merge(*(read_run(run) for run in runs)):
+                check.add(id)
+                out.write(line)
+        os.replace(tmp_path, output_path)
+    return check.summary()
@@ -0,0 +1,446 @@
+import gzip
+import json
+import os
+import sqlite3
+import sys
+
+from maat.create import mask_spans
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def to_json_bytes(record, compact=False):
+    """
+    Serialize a record as a single UTF-8 JSON line (without the newline),
+    as `json.dumps(record, ensure_ascii=False)` does. If `compact`, without
+    spaces after separators, and with orjson when it is installed (the
+    output is the same either way).
+    """
+    if not compact:
+        return json.dumps(record, ensure_ascii=False).encode("utf-8")
+    if orjson is not None:
+        return orjson.dumps(record)
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class Sink:
+    """
+    Somewhere to write records to.
+
+    Records are collected and handed to `write_batch` `batch_size` at a
+    time. A sink is a context manager; leaving it writes the last batch
+    and closes it.
+    """
+
+    def __init__(self, batch_size=1000):
+        self.batch_size = batch_size
+        self.batch = []
+        self.count = 0
+
+    def write(self, record):
+        self.batch.append(record)
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def write_many(self, records):
+        for record in records:
+            self.write(record)
+
+    def flush(self):
+        if self.batch:
+            self.write_batch(self.batch)
+            self.count += len(self.batch)
+            self.batch = []
+
+    def write_batch(self, records):
+        raise NotImplementedError
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class JSONLSink(Sink):
+    """
+    JSON lines, optionally compressed with "gzip" or "zstd" (which needs the
+    zstandard package). With no `path`, they go to standard output. With an
+    `index` path, uncompressed lines written to a file are indexed there as
+    they are written (see `maat.reader.RecordIndex`). If `append`, lines are
+    added to the end of the file instead of replacing it. If `compact`,
+    lines are written without spaces (see `to_json_bytes`).
+    """
+
+    def __init__(
+        self,
+        path=None,
+        compression=None,
+        batch_size=1000,
+        index=None,
+        append=False,
+        compact=False,
+    ):
+        super().__init__(batch_size)
+        self.compact = compact
+        self.index = None
+        if index is not None:
+            if path is None or compression is not None:
+                raise ValueError("Only uncompressed JSON lines files can be indexed")
+            if append:
+                raise ValueError("Files appended to can only be indexed afterwards")
+            from maat.reader import RecordIndex
+
+            self.index = RecordIndex(index)
+            self.offset = 0
+        if path is None:
+            self.file = sys.stdout.buffer
+            self.owns_file = False
+        else:
+            self.file = open(path, "ab" if append else "wb")
+            self.owns_file = True
+        self.compressed = None
+        if compression == "gzip":
+            self.compressed = gzip.GzipFile(fileobj=self.file, mode="wb")
+        elif compression == "zstd":
+            import zstandard
+
+            self.compressed = zstandard.ZstdCompressor().stream_writer(
+                self.file, closefd=False
+            )
+        elif compression is not None:
+            raise ValueError(f"Unknown compression {compression}")
+        self.out = self.compressed if self.compressed is not None else self.file
+
+    def write_batch(self, records):
+        lines = [to_json_bytes(record, self.compact) for record in records]
+        if self.index is not None:
+            for record, line in zip(records, lines):
+                self.index.add(record, self.offset, len(line))
+                self.offset += len(line) + 1
+        self.out.write(b"".join(line + b"\n" for line in lines))
+
+    def sync(self):
+        """
+        Write everything written so far to disk, and return the size of the
+        file. Only uncompressed files can be synced.
+        """
+        if not self.owns_file or self.compressed is not None:
+            raise ValueError("Only uncompressed JSON lines files can be synced")
+        self.flush()
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return self.file.tell()
+
+    def close(self):
+        super().close()
+        if self.compressed is not None:
+            self.compressed.close()
+        if self.owns_file:
+            self.file.close()
+        else:
+            self.file.flush()
+        if self.index is not None:
+            self.index.finish(self.offset)
+
+
+class SQLiteSink(Sink):
+    """
+    A `records` table, with a column per record field, the test cases as
+    JSON, and indexes on `corpus_id` and `language`. Records replace earlier
+    ones with the same `id`.
+    """
+
+    columns = [
+        "id",
+        "corpus_id",
+        "file_id",
+        "block_index",
+        "title",
+        "material",
+        "language",
+        "training_text",
+        "test_cases",
+        "test_case_spans",
+    ]
+
+    def __init__(self, path, batch_size=1000):
+        super().__init__(batch_size)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS records (
+                id TEXT PRIMARY KEY,
+                corpus_id TEXT NOT NULL,
+                file_id TEXT NOT NULL,
+                block_index INTEGER NOT NULL,
+                title TEXT,
+                material TEXT,
+                language TEXT,
+                training_text TEXT NOT NULL,
+                test_cases TEXT,
+                test_case_spans TEXT
+            )
+            """
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS records_corpus_id ON records (corpus_id)"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS records_language ON records (language)"
+        )
+
+    def row(self, record):
+        row = [record.get(column) for column in self.columns]
+        for i in (-2, -1):
+            if row[i] is not None:
+                row[i] = to_json_bytes(row[i], compact=True).decode("utf-8")
+        return row
+
+    def write_batch(self, records):
+        placeholders = ", ".join("?" * len(self.columns))
+        with self.connection:
+            self.connection.executemany(
+                f"INSERT OR REPLACE INTO records VALUES ({placeholders})",
+                [self.row(record) for record in records],
+            )
+
+    def close(self):
+        super().close()
+        self.connection.close()
+
+
+class ParquetSink(Sink):
+    """
+    A Parquet file, for analytics; needs the pyarrow package. Each batch is
+    written as a row group.
+    """
+
+    def __init__(self, path, batch_size=10000):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        super().__init__(batch_size)
+        self.pa = pa
+        case = pa.struct(
+            [
+                ("case_index", pa.int64()),
+                ("id", pa.string()),
+                ("test_case", pa.string()),
+            ]
+        )
+        self.schema = pa.schema(
+            [
+                ("corpus_id", pa.string()),
+                ("file_id", pa.string()),
+                ("block_index", pa.int64()),
+                ("id", pa.string()),
+                ("title", pa.string()),
+                ("material", pa.string()),
+                ("language", pa.string()),
+                ("training_text", pa.string()),
+                ("test_cases", pa.list_(case)),
+                ("test_case_spans", pa.list_(pa.list_(pa.int64()))),
+            ]
+        )
+        self.writer = pq.ParquetWriter(path, self.schema)
+
+    def write_batch(self, records):
+        self.writer.write_table(self.pa.Table.from_pylist(records, self.schema))
+
+    def close(self):
+        super().close()
+        self.writer.close()
+
+
+# Bump when the layout of NumPy exports changes
+NUMPY_FORMAT_VERSION = 1
+
+# The record fields kept in a NumPy shard's blocks.jsonl
+NUMPY_METADATA = [
+    "id",
+    "corpus_id",
+    "file_id",
+    "block_index",
+    "title",
+    "material",
+    "language",
+]
+
+
+def byte_offsets(text, spans):
+    """
+    The `(start, end)` code point `spans` of `text`, in order and not
+    overlapping, as offsets into its UTF-8 encoding. Each stretch of text
+    is encoded once, however many spans there are.
+    """
+    offsets = []
+    position = 0
+    byte_position = 0
+    for start, end in spans:
+        byte_position += len(text[position:start].encode("utf-8"))
+        byte_start = byte_position
+        byte_position += len(text[start:end].encode("utf-8"))
+        position = end
+        offsets.append((byte_start, byte_position))
+    return offsets
+
+
+class NumpySink(Sink):
+    """
+    A directory of `.npy` shards for training loaders, which can open them
+    with `np.load(..., mmap_mode="r")`; needs the numpy package.
+
+    Each shard of up to `shard_size` blocks is a subdirectory holding:
+
+    - `text.npy`: the training texts without brackets (as `mask_spans`
+      returns them), concatenated, as code points (`uint32`) or, with
+      `unit="byte"`, as UTF-8 bytes (`uint8`)
+    - `offsets.npy`: block `i`'s text is `text[offsets[i]:offsets[i + 1]]`
+    - `cases.npy`: a row `(block, start, end, mask_length)` per test case;
+      the case masks `text[start:end]` of the shard (not of the block) with
+      `mask_length` dots
+    - `case_offsets.npy`: block `i`'s cases are
+      `cases[case_offsets[i]:case_offsets[i + 1]]`
+    - `blocks.jsonl`: the other fields of each block (`NUMPY_METADATA`)
+
+    `index.json` lists the shards. See `load_numpy_shard`.
+    """
+
+    def __init__(self, path, unit="codepoint", shard_size=100_000, batch_size=1000):
+        import numpy
+
+        super().__init__(batch_size)
+        if unit not in ["codepoint", "byte"]:
+            raise ValueError(f"Unknown unit {unit}; must be codepoint or byte")
+        self.np = numpy
+        self.path = path
+        self.unit = unit
+        self.shard_size = shard_size
+        self.shards = []
+        os.makedirs(path, exist_ok=True)
+        self.start_shard()
+
+    def start_shard(self):
+        self.texts = []
+        self.offsets = [0]
+        self.cases = []
+        self.case_offsets = [0]
+        self.metadata = []
+
+    def write_batch(self, records):
+        for record in records:
+            self.add(record)
+            if len(self.metadata) >= self.shard_size:
+                self.write_shard()
+
+    def add(self, record):
+        plain_text, spans = mask_spans(record["training_text"])
+        bounds = [(span[0], span[1]) for span in spans]
+        if self.unit == "byte":
+            bounds = byte_offsets(plain_text, bounds)
+            length = len(plain_text.encode("utf-8"))
+        else:
+            length = len(plain_text)
+        block = len(self.metadata)
+        base = self.offsets[-1]
+        for span, (start, end) in zip(spans, bounds):
+            mask_length = span[2] if len(span) > 2 else span[1] - span[0]
+            self.cases.append((block, base + start, base + end, mask_length))
+        self.texts.append(plain_text)
+        self.offsets.append(base + length)
+        self.case_offsets.append(len(self.cases))
+        self.metadata.append({field: record.get(field) for field in NUMPY_METADATA})
+
+    def write_shard(self):
+        if not self.metadata:
+            return
+        np = self.np
+        name = f"shard-{len(self.shards):05d}"
+        directory = os.path.join(self.path, name)
+        os.makedirs(directory, exist_ok=True)
+        text = "".join(self.texts)
+        if self.unit == "byte":
+            array = np.frombuffer(text.encode("utf-8"), dtype=np.uint8)
+        else:
+            array = np.frombuffer(text.encode("utf-32-le"), dtype="<u4")
+        np.save(os.path.join(directory, "text.npy"), array)
+        np.save(
+            os.path.join(directory, "offsets.npy"),
+            np.array(self.offsets, dtype=np.int64),
+        )
+        np.save(
+            os.path.join(directory, "cases.npy"),
+            np.array(self.cases, dtype=np.int64).reshape(-1, 4),
+        )
+        np.save(
+            os.path.join(directory, "case_offsets.npy"),
+            np.array(self.case_offsets, dtype=np.int64),
+        )
+        with open(os.path.join(directory, "blocks.jsonl"), "wb") as file:
+            file.writelines(
+                to_json_bytes(metadata, compact=True) + b"\n"
+                for metadata in self.metadata
+            )
+        self.shards.append(
+            {"name": name, "blocks": len(self.metadata), "cases": len(self.cases)}
+        )
+        self.start_shard()
+
+    def close(self):
+        super().close()
+        self.write_shard()
+        with open(os.path.join(self.path, "index.json"), "w", encoding="utf-8") as file:
+            json.dump(
+                {
+                    "version": NUMPY_FORMAT_VERSION,
+                    "unit": self.unit,
+                    "shards": self.shards,
+                },
+                file,
+                indent=2,
+            )
+
+
+def load_numpy_shard(path):
+    """
+    The arrays of a `NumpySink` shard directory, memory-mapped, by name
+    ("text", "offsets", "cases", "case_offsets")
+    """
+    import numpy
+
+    return {
+        name: numpy.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+        for name in ["text", "offsets", "cases", "case_offsets"]
+    }
+
+
+OUTPUT_FORMATS = ["jsonl", "jsonl.gz", "jsonl.zst", "sqlite", "parquet", "npy"]
+
+
+def open_sink(output_format="jsonl", path=None, **kwargs):
+    """
+    A sink for one of `OUTPUT_FORMATS`, writing to `path`. Only the JSON
+    lines formats can be written to standard output (no `path`).
+    """
+    if output_format == "jsonl":
+        return JSONLSink(path, **kwargs)
+    if output_format == "jsonl.gz":
+        return JSONLSink(path, compression="gzip", **kwargs)
+    if output_format == "jsonl.zst":
+        return JSONLSink(path, compression="zstd", **kwargs)
+    if path is None:
+        raise ValueError(f"The {output_format} format needs an output path")
+    if output_format == "sqlite":
+        return SQLiteSink(path, **kwargs)
+    if output_format == "parquet":
+        return ParquetSink(path, **kwargs)
+    if output_format == "npy":
+        return NumpySink(path, **kwargs)
+    raise ValueError(f"Unknown output format {output_format}")
@@ -0,0 +1,268 @@
+import queue
+import threading
+import time
+
+# Put after the last item, and passed on once every worker of a stage is done
+_END = object()
+
+# How often blocked threads check whether the run was abandoned, in seconds
+_POLL = 0.1
+
+
+class _Failure:
+    """
+    An exception raised by a stage, passed on in place of the item
+    """
+
+    def __init__(self, error):
+        self.error = error
+
+
+class _Abandoned(Exception):
+    pass
+
+
+class Stage:
+    """
+    One step of a `StagedRun`: `func`, applied to each item by `workers`
+    threads, which take the items from a queue of at most `queue_size`.
+
+    A stage that does CPU work in Python should hand it to processes (e.g.
+    with `multiprocessing.Pool.apply`), using its threads only to keep that
+    many items in flight.
+    """
+
+    def __init__(self, name, func, workers=1, queue_size=16):
+        self.name = name
+        self.func = func
+        self.workers = max(workers, 1)
+        self.queue_size = max(queue_size, 1)
+
+
+class StageStats:
+    def __init__(self, stage):
+        self.lock = threading.Lock()
+        self.workers = stage.workers
+        self.capacity = stage.queue_size
+        self.items = 0
+        # seconds spent in `func`, waiting for an item, and waiting for room
+        # in the next queue, summed over the stage's workers
+        self.busy = 0.0
+        self.waiting = 0.0
+        self.blocked = 0.0
+        # depth of the stage's queue, sampled whenever an item is put in it
+        self.depth_samples = 0
+        self.depth_total = 0
+        self.depth_max = 0
+
+    def add_depth(self, depth):
+        with self.lock:
+            self.depth_samples += 1
+            self.depth_total += depth
+            self.depth_max = max(self.depth_max, depth)
+
+    def add_times(self, busy, waiting, blocked):
+        with self.lock:
+            self.items += 1
+            self.busy += busy
+            self.waiting += waiting
+            self.blocked += blocked
+
+    def summary(self):
+        return {
+            "workers": self.workers,
+            "items": self.items,
+            "busy": self.busy,
+            "waiting": self.waiting,
+            "blocked": self.blocked,
+            "queue_capacity": self.capacity,
+            "queue_mean": (
+                self.depth_total / self.depth_samples if self.depth_samples else 0.0
+            ),
+            "queue_max": self.depth_max,
+        }
+
+
+class StagedRun:
+    """
+    Pass items through `stages` connected by bounded queues, so that each
+    stage works on some items while the others work on others: reading
+    files can overlap with converting them, and converting them with
+    writing the results.
+
+    Full queues hold back the stages before them, and at most `window`
+    items (by default, as many as the queues and workers can hold) are in
+    the run at any time, so memory stays flat however slow any one stage
+    is. Results are yielded in input order if `ordered`, otherwise as they
+    come. An exception raised by a stage is raised by `run` when its item
+    would have been yielded.
+
+    `report` says, for each stage, how long its workers were busy, waiting
+    for items and waiting for room downstream, and how full its queue was:
+    the bottleneck is the stage whose queue is full while the next one's is
+    empty.
+    """
+
+    def __init__(self, stages, ordered=True, window=None):
+        self.stages = stages
+        self.ordered = ordered
+        if window is None:
+            window = sum(stage.queue_size + stage.workers for stage in stages)
+        self.window = window
+        self.stats = [StageStats(stage) for stage in stages]
+        # results waiting for the consumer
+        self.output_stats = StageStats(Stage("output", None, 1, window))
+        self.abandoned = threading.Event()
+
+    def report(self):
+        report = {
+            stage.name: stats.summary() for stage, stats in zip(self.stages, self.stats)
+        }
+        output = self.output_stats.summary()
+        report["output"] = {
+            "queue_capacity": output["queue_capacity"],
+            "queue_mean": output["queue_mean"],
+            "queue_max": output["queue_max"],
+        }
+        return report
+
+    def put(self, target, stats, entry):
+        while True:
+            try:
+                target.put(entry, timeout=_POLL)
+                break
+            except queue.Full:
+                if self.abandoned.is_set():
+                    raise _Abandoned()
+        if stats is not None:
+            stats.add_depth(target.qsize())
+
+    def get(self, source):
+        while True:
+            try:
+                return source.get(timeout=_POLL)
+            except queue.Empty:
+                if self.abandoned.is_set():
+                    raise _Abandoned()
+
+    def feed(self, items, target, stats, room):
+        try:
+            for seq, item in enumerate(items):
+                while not room.acquire(timeout=_POLL):
+                    if self.abandoned.is_set():
+                        return
+                self.put(target, stats, (seq, item))
+        except _Abandoned:
+            return
+        except BaseException as e:
+            # the input itself failed; hand the error on after what came before
+            try:
+                self.put(target, stats, (None, _Failure(e)))
+            except _Abandoned:
+                return
+        try:
+            self.put(target, None, _END)
+        except _Abandoned:
+            pass
+
+    def work(self, stage, stats, source, target, target_stats, finished):
+        try:
+            while True:
+                wait_started = time.perf_counter()
+                entry = self.get(source)
+                waiting = time.perf_counter() - wait_started
+                if entry is _END:
+                    # let the stage's other workers see it too
+                    self.put(source, None, _END)
+                    break
+                seq, item = entry
+                started = time.perf_counter()
+                if not isinstance(item, _Failure):
+                    try:
+                        item = stage.func(item)
+                    except BaseException as e:
+                        item = _Failure(e)
+                busy = time.perf_counter() - started
+                self.put(target, target_stats, (seq, item))
+                blocked = time.perf_counter() - started - busy
+                stats.add_times(busy, waiting, blocked)
+        except _Abandoned:
+            return
+        with finished["lock"]:
+            finished["count"] += 1
+            last = finished["count"] == stage.workers
+        if last:
+            try:
+                self.put(target, None, _END)
+            except _Abandoned:
+                pass
+
+    def run(self, items):
+        queues = [queue.Queue(stage.queue_size) for stage in self.stages]
+        queues.append(queue.Queue(self.window))
+        room = threading.Semaphore(self.window)
+        threads = [
+            threading.Thread(
+                target=self.feed,
+                args=(items, queues[0], self.stats[0], room),
+                daemon=True,
+            )
+        ]
+        all_stats = self.stats + [self.output_stats]
+        for i, stage in enumerate(self.stages):
+            finished = {"lock": threading.Lock(), "count": 0}
+            for _ in range(stage.workers):
+                threads.append(
+                    threading.Thread(
+                        target=self.work,
+                        args=(
+                            stage,
+                            self.stats[i],
+                            queues[i],
+                            queues[i + 1],
+                            all_stats[i + 1],
+                            finished,
+                        ),
+                        daemon=True,
+                    )
+                )
+        for thread in threads:
+            thread.start()
+        try:
+            yield from self.results(queues[-1], room)
+        finally:
+            self.abandoned.set()
+            for thread in threads:
+                thread.join()
+
+    def results(self, source, room):
+        pending = {}
+        next_seq = 0
+        input_failure = None
+        while True:
+            entry = source.get()
+            if entry is _END:
+                break
+            seq, item = entry
+            if seq is None:
+                # raised once everything read before it is out
+                input_failure = item
+                continue
+            if not self.ordered:
+                yield self.result(item)
+                # the consumer is done with it
+                room.release()
+                continue
+            pending[seq] = item
+            while next_seq in pending:
+                item = pending.pop(next_seq)
+                next_seq += 1
+                yield self.result(item)
+                room.release()
+        if input_failure is not None:
+            self.result(input_failure)
+
+    def result(self, item):
+        if isinstance(item, _Failure):
+            raise item.error
+        return item
@@ -0,0 +1,201 @@
+import collections
+import json
+import math
+
+import lxml.etree as ET
+
+from maat.create import mask_spans
+from maat.utils import tag_localname
+
+# The relative error of the quantiles of a `Distribution`
+RELATIVE_ERROR = 0.01
+
+# The record fields corpus statistics are broken down by
+BREAKDOWNS = ["corpus_id", "language", "material"]
+
+
+def bin_order(index):
+    # the bin of zeros comes first
+    return -math.inf if index is None else index
+
+
+class Distribution:
+    """
+    The distribution of a stream of non-negative numbers, in a fixed amount
+    of memory: their count, total, minimum and maximum, and a histogram of
+    logarithmic bins, each `RELATIVE_ERROR` wide, from which quantiles and
+    the mode are estimated to within that relative error (exactly, for
+    integers up to about 1 / `RELATIVE_ERROR`). Counting a billion values
+    up to a billion takes about 1,000 bins.
+
+    Distributions of separate streams are combined with `merge`.
+    """
+
+    gamma = (1 + RELATIVE_ERROR) / (1 - RELATIVE_ERROR)
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+        # index of the bin → count; zeros have a bin of their own, None
+        self.bins = collections.Counter()
+
+    def bin(self, value):
+        if value <= 0:
+            return None
+        return math.ceil(math.log(value, self.gamma))
+
+    def value(self, index):
+        """
+        The value standing for a bin: the middle of it, rounded to an
+        integer where that is within the bin
+        """
+        if index is None:
+            return 0
+        middle = 2 * self.gamma**index / (self.gamma + 1)
+        rounded = round(middle)
+        if self.bin(rounded) == index:
+            return rounded
+        return middle
+
+    def add(self, value, count=1):
+        self.count += count
+        self.total += value * count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        self.bins[self.bin(value)] += count
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = round(q * (self.count - 1))
+        seen = 0
+        for index in sorted(self.bins, key=bin_order):
+            seen += self.bins[index]
+            if seen > rank:
+                return min(max(self.value(index), self.min), self.max)
+        return self.max
+
+    def mode(self):
+        if not self.count:
+            return None
+        # the smallest of the most common, whatever order they were added in
+        index = min(self.bins, key=lambda index: (-self.bins[index], bin_order(index)))
+        return self.value(index)
+
+    def merge(self, summary):
+        """
+        Add the `summary` of another distribution to this one
+        """
+        if not summary["count"]:
+            return
+        self.count += summary["count"]
+        self.total += summary["total"]
+        self.min = summary["min"] if self.min is None else min(self.min, summary["min"])
+        self.max = summary["max"] if self.max is None else max(self.max, summary["max"])
+        for index, count in summary["bins"]:
+            self.bins[index] += count
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.total / self.count if self.count else None,
+            "min": self.min,
+            "max": self.max,
+            "mode": self.mode(),
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+            # as pairs, since JSON would make the indexes strings
+            "bins": sorted(self.bins.items(), key=lambda item: bin_order(item[0])),
+        }
+
+
+class CorpusStats:
+    """
+    Statistics of the records of a run, gathered as they are made rather
+    than by reading the output again: the distributions (see
+    `Distribution`) of block lengths (in characters of training text,
+    without brackets), of the number of test cases per block and of mask
+    lengths; the frequency of each element tag in the converted blocks; and
+    the blocks, test cases and characters of each corpus, language and
+    material (`BREAKDOWNS`).
+
+    The memory taken does not grow with the number of records, only with
+    the number of tags, corpora, languages and materials. Statistics from
+    worker processes are combined with `merge`.
+    """
+
+    def __init__(self):
+        self.block_lengths = Distribution()
+        self.cases_per_block = Distribution()
+        self.mask_lengths = Distribution()
+        self.tags = collections.Counter()
+        self.breakdowns = {field: {} for field in BREAKDOWNS}
+
+    def add_tags(self, ab):
+        """
+        Count the tags of the elements of a block
+        """
+        self.tags.update(tag_localname(element) for element in ab.iter(ET.Element))
+
+    def add(self, record):
+        plain_text, spans = mask_spans(record["training_text"])
+        self.block_lengths.add(len(plain_text))
+        self.cases_per_block.add(len(spans))
+        for span in spans:
+            self.mask_lengths.add(span[2] if len(span) > 2 else span[1] - span[0])
+        counts = {"blocks": 1, "cases": len(spans), "characters": len(plain_text)}
+        for field in BREAKDOWNS:
+            self.add_counts(field, record.get(field), counts)
+
+    def add_counts(self, field, value, counts):
+        entry = self.breakdowns[field].setdefault(
+            value, {"blocks": 0, "cases": 0, "characters": 0}
+        )
+        for name, count in counts.items():
+            entry[name] += count
+
+    def take(self):
+        """
+        Return the summary so far and start afresh
+        """
+        summary = self.summary()
+        self.__init__()
+        return summary
+
+    def merge(self, summary):
+        """
+        Add the `summary` of other statistics to these
+        """
+        self.block_lengths.merge(summary["block_lengths"])
+        self.cases_per_block.merge(summary["cases_per_block"])
+        self.mask_lengths.merge(summary["mask_lengths"])
+        self.tags.update(summary["tags"])
+        for field in BREAKDOWNS:
+            for value, counts in summary[field]:
+                self.add_counts(field, value, counts)
+
+    def summary(self):
+        return {
+            "block_lengths": self.block_lengths.summary(),
+            "cases_per_block": self.cases_per_block.summary(),
+            "mask_lengths": self.mask_lengths.summary(),
+            "tags": dict(
+                sorted(self.tags.items(), key=lambda item: (-item[1], item[0]))
+            ),
+            # as pairs, since a value can be None
+            **{
+                field: sorted(
+                    self.breakdowns[field].items(),
+                    key=lambda item: (-item[1]["blocks"], str(item[0])),
+                )
+                for field in BREAKDOWNS
+            },
+        }
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.summary(), file, indent=2, ensure_ascii=False)
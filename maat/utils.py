@@ -1,6 +1,23 @@
+import collections
+import threading
+
 import lxml.etree as ET
 from lxml.etree import QName
 
+_parsers = threading.local()
+
+
+def xml_parser():
+    """
+    The `XMLParser(recover=True, remove_blank_text=True)` used for all
+    documents and markup, created once per thread (and so once per worker
+    process) and reused, as lxml parsers must not be shared between threads
+    """
+    parser = getattr(_parsers, "parser", None)
+    if parser is None:
+        parser = _parsers.parser = ET.XMLParser(recover=True, remove_blank_text=True)
+    return parser
+
 
 def to_string(element, pretty_print=False):
     """
@@ -15,7 +32,10 @@ def tag_localname(element):
     """
     Get the localname of an element
     """
-    return QName(element.tag).localname
+    tag = element.tag
+    if isinstance(tag, str):
+        return tag.rpartition("}")[2]
+    return QName(tag).localname
 
 
 def children(element):
@@ -132,7 +152,7 @@ def mode(ns):
     """
     if not ns:
         return 0
-    return max(set(ns), key=ns.count)
+    return collections.Counter(ns).most_common(1)[0][0]
 
 
 def mode_length(ns):
@@ -0,0 +1,41 @@
+import copy
+
+import lxml.etree as ET
+
+from benchmarks.stages import STAGES, benchmark, regressions
+from benchmarks.synthetic import SyntheticCorpus
+from maat.pipeline import Pipeline
+
+
+def test_synthetic_documents_are_deterministic():
+    corpus = SyntheticCorpus(seed=1)
+    assert corpus.document(3) == SyntheticCorpus(seed=1).document(3)
+    assert corpus.document(3) != SyntheticCorpus(seed=2).document(3)
+
+
+def test_synthetic_documents_convert(tmp_path):
+    corpus = SyntheticCorpus(blocks=2, block_words=50, depth=4, density=0.5)
+    paths = corpus.write(str(tmp_path), 4)
+    for path in paths:
+        ET.parse(path)
+    records = [r for path in paths for r in Pipeline().process(path)]
+    assert len(records) == 8
+    assert any(r["test_cases"] for r in records)
+
+
+def test_benchmark_results(tmp_path):
+    paths = SyntheticCorpus(block_words=20).write(str(tmp_path), 2)
+    results = benchmark({"synthetic": paths}, repeat=1)
+    corpus = results["corpora"]["synthetic"]
+    assert (corpus["documents"], corpus["blocks"]) == (2, 6)
+    assert list(corpus["stages"]) == STAGES
+    assert corpus["total"]["seconds"] > 0
+
+    assert regressions(results, results) == []
+    faster = copy.deepcopy(results)
+    for timing in faster["corpora"]["synthetic"]["stages"].values():
+        timing["seconds"] /= 2
+    slower = regressions(results, faster)
+    assert [stage for _, stage, _, _ in slower if stage != "total"] == [
+        stage for stage in STAGES if corpus["stages"][stage]["seconds"]
+    ]
@@ -0,0 +1,58 @@
+import os
+import pickle
+import sqlite3
+
+import lxml.etree as ET
+
+from maat.cache import BlockCache
+from maat.errors import ErrorReport
+from maat.pipeline import Pipeline, convert_files, xml_files
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+
+
+def test_get_and_put(tmp_path):
+    cache = BlockCache(str(tmp_path / "cache.sqlite"), batch_size=2)
+    doc = ET.fromstring(
+        '<div><ab n="1">text</ab><supplied><ab n="1">text</ab></supplied></div>'
+    )
+    key = cache.key(doc[0])
+    # the same block inside a supplied element converts differently
+    assert cache.key(doc[1][0]) != key
+    assert cache.get(key) is None
+    cache.put(key, "text", [(ValueError("Invalid quantity: x"), "gap")])
+    cache.close()
+
+    cache = pickle.loads(pickle.dumps(cache))
+    training_text, [(error, tag)] = cache.get(key)
+    assert training_text == "text"
+    assert (type(error), str(error), tag) == (ValueError, "Invalid quantity: x", "gap")
+    assert cache.take() == {"hits": 1, "misses": 0, "writes": 0, "evictions": 0}
+
+
+def test_eviction(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = BlockCache(path, max_bytes=1000, batch_size=1)
+    for i in range(20):
+        cache.put(bytes([i]) * 32, "x" * 100)
+    cache.close()
+    connection = sqlite3.connect(path)
+    ((count, size),) = connection.execute("SELECT count(*), sum(size) FROM blocks")
+    assert size <= 1000
+    assert connection.execute("SELECT total FROM size").fetchone() == (size,)
+    # the most recent entries are kept
+    assert cache.get(bytes([19]) * 32) is not None
+    assert cache.get(bytes([0]) * 32) is None
+    assert cache.stats["evictions"] == 20 - count
+
+
+def test_cached_pipeline(tmp_path):
+    paths = list(xml_files(DATA_DIR))
+    expected = list(convert_files(paths))
+    cache = BlockCache(str(tmp_path / "cache.sqlite"))
+    for hits in [0, len(expected)]:
+        report = ErrorReport()
+        pipeline = Pipeline(error_report=report, block_cache=cache)
+        assert [r for path in paths for r in pipeline.process(path)] == expected
+        assert cache.take()["hits"] == hits
+        cache.flush()
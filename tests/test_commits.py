@@ -0,0 +1,67 @@
+import json
+
+import pytest
+
+from maat.commits import CommitLog, commit_log_path, write_committed
+from maat.sinks import JSONLSink
+
+
+def batches(file_paths):
+    for file_path in file_paths:
+        yield file_path, [{"id": f"{file_path}/{b}"} for b in range(1, 3)]
+
+
+class Crash(Exception):
+    pass
+
+
+def crashing(batches, after):
+    for i, batch in enumerate(batches):
+        if i == after:
+            raise Crash()
+        yield batch
+
+
+def read_ids(path):
+    with open(path, encoding="utf-8") as file:
+        return [json.loads(line)["id"] for line in file]
+
+
+def test_resume_after_a_crash(tmp_path):
+    files = [f"f{i}.xml" for i in range(10)]
+    output = str(tmp_path / "maat.jsonl")
+    log_path = commit_log_path(output)
+    with CommitLog(log_path) as log:
+        assert not log.restore(output)
+        with pytest.raises(Crash):
+            with JSONLSink(output) as sink:
+                write_committed(crashing(batches(files), 7), sink, log, every=3)
+    # the crash left a half-written line in the output and in the log
+    with open(output, "ab") as file:
+        file.write(b'{"id": "f6.xml/1"}\n{"id": "f7')
+    with open(log_path, "ab") as file:
+        file.write(b'{"files": ["f6.xml"')
+
+    with CommitLog(log_path) as log:
+        assert log.files == set(files[:6])
+        assert log.restore(output)
+        assert read_ids(output) == [f"{f}/{b}" for f in files[:6] for b in (1, 2)]
+        remaining = [f for f in files if f not in log.files]
+        with JSONLSink(output, append=True) as sink:
+            assert write_committed(batches(remaining), sink, log, every=3) == 4
+    assert read_ids(output) == [f"{f}/{b}" for f in files for b in (1, 2)]
+    with CommitLog(log_path) as log:
+        assert log.files == set(files)
+        assert log.commits == 4
+
+
+def test_output_shorter_than_committed_is_refused(tmp_path):
+    output = str(tmp_path / "maat.jsonl")
+    with CommitLog(commit_log_path(output)) as log:
+        with JSONLSink(output) as sink:
+            write_committed(batches(["a.xml"]), sink, log)
+    with open(output, "wb"):
+        pass
+    with CommitLog(commit_log_path(output)) as log:
+        with pytest.raises(ValueError):
+            log.restore(output)
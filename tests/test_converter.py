@@ -1,12 +1,23 @@
+import re
+
 import pytest
 import lxml.etree as ET
 from maat.converter import (
+    ALT_END,
+    ALT_START,
+    GAP,
+    SUPPLIED_END,
+    SUPPLIED_START,
+    build_ab,
+    content_training_text,
+    markup_text,
     remove_gaps_from_supplied_text,
     which_test_context,
     in_supplied_element,
     Converter,
 )
-from maat.utils import to_string
+from maat.create import create_training_text
+from maat.utils import to_string, xml_parser
 
 
 @pytest.fixture
@@ -136,3 +147,173 @@ def test_space_default():
     )
     txt = converter._convert(element)
     assert txt == "\n    Text\n"
+
+
+@pytest.mark.parametrize(
+    "xml_string, expected",
+    [
+        (
+            '<ab>αβ<supplied reason="lost">γδ.ε</supplied> <gap reason="lost" quantity="2" unit="character"/><lb/>ζ</ab>',
+            "αβ[γδ].[ε] ..\nζ",
+        ),
+        # blanks between elements are dropped, until there has been text
+        (
+            '<ab><gap reason="lost" extent="unknown" unit="line"/><lb/><supplied reason="lost">a</supplied> <supplied reason="lost">b</supplied></ab>',
+            "<gap/>[a][b]",
+        ),
+        (
+            '<ab>x<supplied reason="lost">a</supplied> <supplied reason="lost">b</supplied></ab>',
+            "x[a] [b]",
+        ),
+        (
+            '<ab>x<supplied reason="lost"><choice><unclear>a</unclear><unclear>b</unclear></choice></supplied></ab>',
+            "x[a]",
+        ),
+        # text is left as it is, not escaped
+        ("<ab>a &lt; b &amp; c</ab>", "a < b & c"),
+    ],
+)
+def test_training_text(xml_string, expected):
+    assert Converter().training_text(ET.fromstring(xml_string)) == expected
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        [SUPPLIED_START, "cd", SUPPLIED_END, " ", SUPPLIED_START, "ef", SUPPLIED_END],
+        [GAP, "\n", GAP],
+        [GAP, "x", GAP, " ", GAP],
+        ["  ", GAP, "x"],
+        ["\xa0", GAP, " ", GAP],
+        [SUPPLIED_START, "  ", SUPPLIED_END, "x"],
+        [
+            SUPPLIED_START,
+            ALT_START,
+            " ",
+            ALT_END,
+            ALT_START,
+            "a",
+            ALT_END,
+            SUPPLIED_END,
+        ],
+        "   ",
+    ],
+)
+def test_blanks_are_dropped_as_the_parser_does(content):
+    markup = f"<ab>{markup_text(content)}</ab>"
+    parsed = ET.fromstring(markup, parser=xml_parser())
+    assert to_string(build_ab(content)) == to_string(parsed)
+    expected = re.sub(r"</?ab[^>]*>", "", to_string(create_training_text(parsed)))
+    assert content_training_text(content) == expected
+
+
+def test_convert_builds_tags_as_elements():
+    element = ET.fromstring(
+        '<ab>x<supplied reason="lost">a.<gap unit="line"/></supplied></ab>'
+    )
+    converter = Converter()
+    assert converter.markup(element) == (
+        "x<supplied>a</supplied>.<supplied><gap /></supplied>"
+    )
+    assert to_string(converter.convert(element)) == (
+        "<ab>x<supplied>a</supplied>.<supplied><gap/></supplied></ab>"
+    )
+
+
+ENGINE_CASES = [
+    "<ab>Text</ab>",
+    '<ab><app type="alternative"><lem>a</lem><rdg>b</rdg></app></ab>',
+    '<ab><app type="note"><lem>a</lem></app><unknown>x</unknown></ab>',
+    '<ab>α<supplied reason="lost">β<gap quantity="2"/>γ</supplied><lb/>δ</ab>',
+    '<ab><supplied reason="omitted">x</supplied><choice><sic>a</sic><corr>b</corr></choice></ab>',
+    '<ab><choice><corr>b</corr></choice><gap quantity="x"/></ab>',
+    '<ab><supplied reason="lost"><choice><unclear>a</unclear><unclear>b</unclear></choice></supplied></ab>',
+]
+
+
+@pytest.mark.parametrize("xml_string", ENGINE_CASES)
+def test_engines_agree(xml_string):
+    element = ET.fromstring(xml_string)
+    recursive = Converter(engine="recursive")
+    iterative = Converter(engine="iterative")
+    assert iterative.markup(element) == recursive.markup(element)
+    assert [str(e) for e in iterative.errors] == [str(e) for e in recursive.errors]
+    assert iterative.max_depth == recursive.max_depth
+    assert iterative.depth == recursive.depth == 0
+
+
+def test_iterative_engine_handles_deep_nesting():
+    element = ET.Element("ab")
+    inner = element
+    for _ in range(5000):
+        inner = ET.SubElement(inner, "hi")
+    inner.text = "deep"
+    converter = Converter(engine="iterative")
+    assert converter.markup(element) == "deep"
+    assert converter.max_depth == 5001
+    with pytest.raises(RecursionError):
+        Converter(engine="recursive").markup(element)
+
+
+def test_iterative_engine_uses_overridden_handlers():
+    class Shouting(Converter):
+        def hi_text(self, element):
+            return self.default_handler(element).upper()
+
+    element = ET.fromstring("<ab>a<hi>b<num>c</num></hi></ab>")
+    assert Shouting(engine="iterative").markup(element) == "aBC"
+
+
+def test_unknown_engine():
+    with pytest.raises(ValueError):
+        Converter(engine="quantum")
+
+
+def test_handlers_are_keyed_on_clark_names():
+    tei = "{http://www.tei-c.org/ns/1.0}"
+    assert Converter.tag_handlers[tei + "gap"] is Converter.tag_handlers["gap"]
+    element = ET.fromstring(
+        '<ab xmlns="http://www.tei-c.org/ns/1.0">a<gap quantity="2"/>b</ab>'
+    )
+    assert Converter().markup(element) == "a..b"
+
+
+def test_reset():
+    converter = Converter()
+    converter.markup(ET.fromstring("<ab><unknown>x</unknown></ab>"))
+    assert converter.errors
+    converter.reset()
+    assert converter.errors == []
+    assert converter.max_depth == 0
+
+
+@pytest.mark.parametrize("engine", ["recursive", "iterative"])
+def test_register_tag_handler(engine):
+    class Named(Converter):
+        pass
+
+    @Named.register_tag_handler("persName")
+    def persName_text(converter, element):
+        return "<" + converter.default_handler(element) + ">"
+
+    Named.register_tag_handler("hi", lambda converter, element: "")
+    element = ET.fromstring("<ab><persName>x<hi>y</hi></persName></ab>")
+    converter = Named(engine=engine)
+    assert converter.markup(element) == "<x>"
+    assert converter.errors == []
+    assert "persName" not in Converter.tag_handlers
+
+
+@pytest.mark.parametrize("engine", ["recursive", "iterative"])
+def test_supplied_context_is_carried_down(engine):
+    converter = Converter(engine=engine)
+    choice = "<choice><sic>a</sic><orig>b</orig></choice>"
+    element = ET.fromstring(
+        f'<ab>{choice}<supplied reason="lost">{choice}</supplied></ab>'
+    )
+    expected = "a<supplied><alt>a</alt><alt>b</alt></supplied>"
+    assert converter.markup(element) == expected
+    assert converter.supplied_depth == 0
+    # a supplied element above the converted one counts too
+    inner = ET.fromstring(f"<supplied><ab>{choice}</ab></supplied>")[0]
+    assert converter.markup(inner) == "<alt>a</alt><alt>b</alt>"
@@ -0,0 +1,18 @@
+import pytest
+
+from maat.create import create_test_cases, mask_spans, materialize_test_case
+
+
+@pytest.mark.parametrize(
+    "text",
+    ["", "abc", "a[bc]d", "[a] [b.c]", "a[b[c]d]e", "[x]]y[[z]", "[]a[.]"],
+)
+def test_mask_spans_rebuild_test_cases(text):
+    plain_text, spans = mask_spans(text)
+    assert plain_text == text.replace("[", "").replace("]", "")
+    cases = [materialize_test_case(plain_text, span) for span in spans]
+    assert cases == list(create_test_cases(text))
+
+
+def test_mask_spans_mask_length():
+    assert mask_spans("a[b[c]d") == ("abcd", [[1, 3, 3]])
@@ -0,0 +1,86 @@
+import random
+
+import pytest
+
+from maat import dedup
+from maat.dedup import Deduplicator, lsh_bands, normalized_text, shingle_hashes
+
+TEXT = (
+    "ἔτους τρίτου Αὐτοκράτορος Καίσαρος Τίτου Αἰλίου Ἁδριανοῦ Ἀντωνίνου "
+    "Σεβαστοῦ Εὐσεβοῦς Φαρμοῦθι ὁμολογεῖ Ἀπολλώνιος Πτολεμαίου ἀπὸ κώμης "
+    "Καρανίδος ἀπέχειν παρὰ Ἡρακλείδου τὰς συμπεφωνημένας δραχμὰς ἑκατόν"
+)
+
+
+def record(id, training_text):
+    return {"id": id, "training_text": training_text}
+
+
+def test_normalized_text():
+    assert normalized_text("Ἀπολ[λώ]νιος ..<gap/> Πτολ[εμαίου]") == (
+        "απολλωνιος πτολεμαιου"
+    )
+
+
+def test_lsh_bands():
+    bands, rows = lsh_bands(64, 0.8)
+    assert bands * rows == 64
+    assert abs((1 / bands) ** (1 / rows) - 0.8) < 0.1
+
+
+def test_near_duplicates_are_tagged_and_dropped():
+    rng = random.Random(0)
+    words = TEXT.split()
+    other = " ".join(rng.sample(words, len(words)))
+    records = [
+        record("DDbDP/p.1/1", TEXT),
+        record("DCLP/1/1", other),
+        # another edition: brackets, a lost word and different accents
+        record("EDH/1/1", TEXT.replace("Τίτου", "[Τί]του").replace("ά", "α")),
+        record("DDbDP/p.2/1", ""),
+    ]
+    tagged = list(Deduplicator().filter(records, "tag"))
+    assert [r.get("duplicate_of") for r in tagged] == [
+        None,
+        None,
+        "DDbDP/p.1/1",
+        None,
+    ]
+    deduplicator = Deduplicator()
+    kept = list(deduplicator.filter(records, "drop"))
+    assert [r["id"] for r in kept] == ["DDbDP/p.1/1", "DCLP/1/1", "DDbDP/p.2/1"]
+    assert deduplicator.clusters() == [["DDbDP/p.1/1", "EDH/1/1"]]
+    assert deduplicator.summary()["duplicates"] == 1
+    with pytest.raises(ValueError):
+        list(deduplicator.filter(records, "keep"))
+
+
+def test_signatures_do_not_depend_on_numpy(monkeypatch):
+    pytest.importorskip("numpy")
+    hashes = shingle_hashes(normalized_text(TEXT))
+    with_numpy = Deduplicator().signature(hashes)
+    monkeypatch.setattr(dedup, "numpy", None)
+    assert Deduplicator().signature(hashes) == with_numpy
+
+
+def test_unrelated_blocks_are_not_near_duplicates():
+    rng = random.Random(0)
+    letters = "αβγδεζηθικλμνξοπρστυφχψω "
+    deduplicator = Deduplicator()
+    for i in range(300):
+        text = "".join(rng.choice(letters) for _ in range(300))
+        assert deduplicator.add(record(str(i), text)) is None
+
+
+def test_only_blocks_that_are_not_duplicates_are_kept():
+    deduplicator = Deduplicator()
+    records = [record("DDbDP/p.1/1", TEXT), record("DDbDP/p.2/1", "")]
+    records += [record(f"EDH/{i}/1", TEXT) for i in range(50)]
+    kept = list(deduplicator.filter(records, "drop"))
+    assert [r["id"] for r in kept] == ["DDbDP/p.1/1", "DDbDP/p.2/1"]
+    assert deduplicator.ids == ["DDbDP/p.1/1"]
+    assert len(deduplicator.signatures) == deduplicator.num_perm
+    assert deduplicator.clusters() == [
+        ["DDbDP/p.1/1"] + [f"EDH/{i}/1" for i in range(50)]
+    ]
+    assert deduplicator.summary()["blocks"] == 52
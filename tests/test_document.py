@@ -0,0 +1,176 @@
+import lxml.etree as ET
+import pytest
+
+from maat.document import (
+    block_contexts,
+    collect_header_field,
+    edition_blocks,
+    header_idno,
+    header_idno_hgv,
+    header_material,
+    header_metadata,
+    header_title,
+    is_edition,
+    parse_bytes,
+    read_file,
+    read_header,
+    record_parse_timings,
+    reported_language,
+    stream_abs,
+    take_parse_timings,
+    TEI_AB,
+)
+
+TEI_DOC = """<TEI xmlns="http://www.tei-c.org/ns/1.0">
+<teiHeader><fileDesc>
+<titleStmt><title>A title</title></titleStmt>
+<publicationStmt>
+<idno type="TM">1234</idno>
+<idno type="filename">p.test.1</idno>
+<idno type="HGV">1234a 1234b</idno>
+</publicationStmt>
+</fileDesc></teiHeader>
+<text><body>
+<div type="translation"><ab>Not an edition</ab></div>
+<div type="edition" xml:lang="grc">
+{abs}
+</div>
+</body></text>
+</TEI>
+"""
+
+
+def write_doc(tmp_path, abs):
+    path = tmp_path / "doc.xml"
+    path.write_text(TEI_DOC.format(abs=abs))
+    return str(path)
+
+
+def test_stream_abs_header(tmp_path):
+    path = write_doc(tmp_path, "<ab>first block</ab>")
+    doc = ET.parse(path)
+    for header, ab, lang in stream_abs(path):
+        assert is_edition(ab)
+        assert reported_language(ab) == lang == "grc"
+    assert header == read_header(doc)
+    assert header_idno(header) == "p.test.1"
+    assert header_idno_hgv(header) == "1234a"
+    assert header_title(header) == "A title"
+    assert header_material(header, None) == "unknown"
+
+
+def test_read_file_from_bytes(tmp_path):
+    path = write_doc(tmp_path, "<ab>πρῶτον</ab>")
+    with open(path, encoding="utf-8") as file:
+        parser = ET.XMLParser(recover=True, remove_blank_text=True)
+        expected = ET.tostring(ET.parse(file, parser))
+    data = open(path, "rb").read()
+    assert ET.tostring(read_file(path)) == ET.tostring(read_file(path, data))
+    assert ET.tostring(read_file(path)) == expected
+    latin1 = '<?xml version="1.0" encoding="ISO-8859-1"?><ab>\xe9</ab>'
+    assert parse_bytes(latin1.encode("latin-1")).getroot().text == "é"
+    with pytest.raises(ET.XMLSyntaxError):
+        parse_bytes(b"not xml")
+
+
+def test_parse_timings(tmp_path):
+    path = write_doc(tmp_path, "<ab>first block</ab>")
+    record_parse_timings()
+    read_file(path)
+    read_file(path, what="hgv")
+    read_file(path, what="hgv")
+    timings = take_parse_timings()
+    assert timings["parse"]["calls"] == 1
+    assert timings["parse_hgv"]["calls"] == 2
+    assert take_parse_timings() == {}
+
+
+def test_collect_header_field_keeps_first():
+    header = {}
+    for text in ["a", "b"]:
+        element = ET.fromstring(
+            f'<idno xmlns="http://www.tei-c.org/ns/1.0">{text}</idno>'
+        )
+        collect_header_field(header, element)
+    assert header_idno(header) == "a"
+    assert header_idno({}) == "unknown"
+
+
+def test_stream_abs_nested_in_document_order(tmp_path):
+    path = write_doc(tmp_path, "<ab>outer<ab>inner</ab></ab><ab>last</ab>")
+    texts = [ab.text for _, ab, _ in stream_abs(path)]
+    assert texts == ["outer", "inner", "last"]
+
+
+def test_stream_abs_matches_edition_blocks_when_nested(tmp_path):
+    path = tmp_path / "doc.xml"
+    path.write_text(
+        TEI_DOC.format(abs='<ab>e<div type="edition"><ab>f</ab></div></ab>').replace(
+            "<ab>Not an edition</ab>",
+            '<ab>outside<div type="edition" xml:lang="la"><ab>a<ab>b</ab></ab>'
+            "</div><ab>not edition</ab></ab>",
+        )
+    )
+    streamed = [(ab.text, lang) for _, ab, lang in stream_abs(str(path))]
+    parsed = [(ab.text, lang) for ab, lang in edition_blocks(ET.parse(str(path)))]
+    assert streamed == parsed
+    assert streamed == [("a", "la"), ("b", "la"), ("e", "grc"), ("f", "grc")]
+
+
+def test_stream_abs_clears_finished_blocks(tmp_path):
+    path = write_doc(tmp_path, "".join(f"<ab>block {i}</ab>" for i in range(100)))
+    preceding = [list(ab.itersiblings(preceding=True)) for _, ab, _ in stream_abs(path)]
+    assert len(preceding) == 100
+    # only the block just before survives, and it has been emptied
+    assert all(len(siblings) <= 1 for siblings in preceding)
+    assert all(not s.text for siblings in preceding for s in siblings)
+
+
+def test_block_contexts_match_ancestor_walks(tmp_path):
+    path = write_doc(
+        tmp_path,
+        '<ab>a<ab xml:lang="la">b<!-- c --><ab>c</ab></ab></ab><ab xml:lang="">d</ab>',
+    )
+    doc = ET.parse(path)
+    contexts = list(block_contexts(doc.getroot()))
+    assert [ab for ab, _, _ in contexts] == list(doc.iter(TEI_AB))
+    for ab, in_edition, lang in contexts:
+        assert in_edition == is_edition(ab)
+        assert lang == reported_language(ab)
+    streamed = [(ab.text, lang) for _, ab, lang in stream_abs(path)]
+    assert streamed == [("a", "grc"), ("b", "la"), ("c", "la"), ("d", "")]
+
+
+def test_edition_blocks_match_block_contexts(tmp_path):
+    path = write_doc(
+        tmp_path,
+        '<ab>a<ab xml:lang="la">b</ab></ab><div type="edition"><ab>c</ab></div>',
+    )
+    doc = ET.parse(path)
+    expected = [
+        (ab, lang)
+        for ab, in_edition, lang in block_contexts(doc.getroot())
+        if in_edition
+    ]
+    assert list(edition_blocks(doc)) == expected
+    assert [(ab.text, lang) for ab, lang in expected] == [
+        ("a", "grc"),
+        ("b", "la"),
+        ("c", "grc"),
+    ]
+
+
+def test_read_header(tmp_path):
+    doc = ET.parse(write_doc(tmp_path, "<ab>first block</ab>"))
+    header = read_header(doc)
+    assert header_metadata(header, None) == {
+        "idno": "p.test.1",
+        "idno_hgv": "1234a",
+        "title": "A title",
+        "material": "unknown",
+    }
+    # only the teiHeader is searched, as `stream_abs` does
+    no_header = ET.fromstring(
+        '<TEI xmlns="http://www.tei-c.org/ns/1.0"><text><title>T</title></text></TEI>'
+    )
+    assert header_title(read_header(no_header)) == "unknown"
@@ -0,0 +1,69 @@
+from maat.errors import ErrorReport
+from maat.language import build_detector
+from maat.pipeline import Pipeline, convert_files
+
+NOISY_DOC = """<TEI xmlns="http://www.tei-c.org/ns/1.0">
+<teiHeader><fileDesc><publicationStmt>
+<idno type="filename">p.noisy.{number}</idno>
+</publicationStmt></fileDesc></teiHeader>
+<text><body><div type="edition" xml:lang="grc">
+<ab>ἀρχή <unknown>x</unknown> <gap quantity="x"/> <gap quantity="y"/> τέλος</ab>
+</div></body></text>
+</TEI>
+"""
+
+
+def noisy_files(tmp_path, count):
+    paths = []
+    for number in range(count):
+        path = tmp_path / f"noisy.{number}.xml"
+        path.write_text(NOISY_DOC.format(number=number), encoding="utf-8")
+        paths.append(str(path))
+    return paths
+
+
+def test_error_report_counts_and_samples():
+    report = ErrorReport(samples=2)
+    for i in range(3):
+        report.add(ValueError(f"bad {i}"), "gap", where=f"file {i}")
+    report.add(KeyError("x"), with_traceback=True)
+    summary = report.summary()
+    assert summary["total"] == 4
+    gap = summary["errors"]["ValueError:gap"]
+    assert gap["count"] == 3
+    assert [e["where"] for e in gap["examples"]] == ["file 0", "file 1"]
+    assert "traceback" in summary["errors"]["KeyError:"]["examples"][0]
+
+    merged = ErrorReport(samples=2)
+    merged.merge(report.take())
+    merged.merge(summary)
+    assert merged.summary()["errors"]["ValueError:gap"]["count"] == 6
+    assert len(merged.summary()["errors"]["ValueError:gap"]["examples"]) == 2
+    assert report.total() == 0
+
+
+def test_pipeline_reports_converter_errors(tmp_path):
+    (path,) = noisy_files(tmp_path, 1)
+    pipeline = Pipeline(build_detector())
+    assert len(pipeline.process_all(path)) == 1
+    errors = pipeline.error_report.summary()["errors"]
+    assert errors["ValueError:gap"]["count"] == 2
+    assert errors["ValueError:unknown"]["examples"][0] == {
+        "message": "No handler for unknown",
+        "where": f"{path} 0",
+    }
+
+
+def test_worker_error_reports_are_merged(tmp_path):
+    paths = noisy_files(tmp_path, 4)
+    report = ErrorReport()
+    records = convert_files(
+        paths,
+        workers=2,
+        chunksize=1,
+        detector_factory=build_detector,
+        error_report=report,
+    )
+    assert len(list(records)) == 4
+    assert report.summary()["errors"]["ValueError:gap"]["count"] == 8
+    assert report.total() == 12
@@ -0,0 +1,47 @@
+import os
+
+from maat.files import listed_xml_files, prefetched, xml_files
+
+
+def make_tree(root):
+    for path in ["b/2.xml", "b/c/3.xml", "1.xml", "notes.txt", "a/4.xml"]:
+        path = root / path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(f"<ab>{path.name}</ab>")
+
+
+def test_xml_files_in_walk_order(tmp_path):
+    make_tree(tmp_path)
+    walked = [
+        os.path.join(root, file)
+        for root, dirs, files in os.walk(tmp_path)
+        for file in files
+        if file.endswith(".xml")
+    ]
+    assert list(xml_files(tmp_path)) == walked
+    assert len(walked) == 4
+
+
+def test_file_list_is_reused(tmp_path):
+    root = tmp_path / "corpus"
+    make_tree(root)
+    file_list = str(tmp_path / "files.json")
+    listing = listed_xml_files([str(root)], file_list)
+    (root / "5.xml").write_text("<ab/>")
+    assert listed_xml_files([str(root)], file_list) == listing
+    rescanned = listed_xml_files([str(root)], file_list, rescan=True)
+    assert len(rescanned[0][1]) == 5
+    # another set of directories is scanned afresh
+    assert listed_xml_files([str(root / "b")], file_list)[0][1] == [
+        str(root / "b" / "2.xml"),
+        str(root / "b" / "c" / "3.xml"),
+    ]
+
+
+def test_prefetched(tmp_path):
+    make_tree(tmp_path)
+    paths = list(xml_files(tmp_path)) + [str(tmp_path / "missing.xml")]
+    fetched = list(prefetched(paths, threads=2, buffer=2))
+    assert [path for path, _ in fetched] == paths
+    assert fetched[0][1] == f"<ab>{os.path.basename(paths[0])}</ab>".encode()
+    assert fetched[-1][1] is None
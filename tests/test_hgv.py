@@ -0,0 +1,76 @@
+import os
+import pickle
+
+import lxml.etree as ET
+import pytest
+
+from maat.document import header_material, read_header
+from maat.hgv import HGVIndex
+
+HGV_DOC = """<TEI xmlns="http://www.tei-c.org/ns/1.0"><teiHeader><fileDesc>
+<sourceDesc><msDesc><physDesc><objectDesc><supportDesc><support>
+<material>{material}</material>
+</support></supportDesc></objectDesc></physDesc></msDesc></sourceDesc>
+</fileDesc></teiHeader></TEI>
+"""
+
+DDB_DOC = """<TEI xmlns="http://www.tei-c.org/ns/1.0"><teiHeader><fileDesc>
+<publicationStmt><idno type="HGV">{hgv_id}</idno></publicationStmt>
+</fileDesc></teiHeader></TEI>
+"""
+
+
+@pytest.fixture
+def idp_data(tmp_path):
+    root = tmp_path / "idp.data"
+    hgv = root / "HGV_meta_EpiDoc" / "HGV2"
+    hgv.mkdir(parents=True)
+    (hgv / "1234.xml").write_text(HGV_DOC.format(material="Papyrus"))
+    (hgv / "1235a.xml").write_text(HGV_DOC.format(material="Ostrakon"))
+    ddb = root / "DDB_EpiDoc_XML" / "p.test"
+    ddb.mkdir(parents=True)
+    for hgv_id in ["1234", "1235a", "1999"]:
+        (ddb / f"{hgv_id}.xml").write_text(DDB_DOC.format(hgv_id=hgv_id))
+    return root
+
+
+@pytest.fixture
+def hgv_index(idp_data, tmp_path):
+    index = HGVIndex(str(tmp_path / "hgv.sqlite"), idp_data / "HGV_meta_EpiDoc")
+    yield index
+    index.close()
+
+
+def ddb_material(idp_data, hgv_id, hgv_index=None):
+    path = str(idp_data / "DDB_EpiDoc_XML" / "p.test" / f"{hgv_id}.xml")
+    return header_material(read_header(ET.parse(path)), path, hgv_index)
+
+
+def test_refresh_parses_only_changes(idp_data, hgv_index):
+    assert hgv_index.refresh() == 2
+    assert hgv_index.refresh() == 0
+    changed = idp_data / "HGV_meta_EpiDoc" / "HGV2" / "1234.xml"
+    changed.write_text(HGV_DOC.format(material="Parchment"))
+    os.utime(changed, ns=(1, 1))
+    assert hgv_index.refresh() == 1
+    assert hgv_index.material_by_id("1234") == "Parchment"
+
+
+def test_refresh_drops_deleted_files(idp_data, hgv_index):
+    hgv_index.refresh()
+    os.remove(idp_data / "HGV_meta_EpiDoc" / "HGV2" / "1235a.xml")
+    hgv_index.refresh()
+    assert hgv_index.material_by_id("1235a") is None
+
+
+@pytest.mark.parametrize("hgv_id", ["1234", "1235a", "1999"])
+def test_lookup_matches_parsing(idp_data, hgv_index, hgv_id):
+    hgv_index.refresh()
+    assert ddb_material(idp_data, hgv_id, hgv_index) == ddb_material(idp_data, hgv_id)
+
+
+def test_index_pickles_without_connection(idp_data, hgv_index):
+    hgv_index.refresh()
+    copy = pickle.loads(pickle.dumps(hgv_index))
+    assert copy.material_by_id("1234") == "Papyrus"
+    copy.close()
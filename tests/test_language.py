@@ -0,0 +1,49 @@
+import lxml.etree as ET
+
+from maat.language import LanguageDetector, languages, unknown_languages
+
+LATIN = "Dis Manibus sacrum hic situs est sit tibi terra levis"
+GREEK = "ἔτους δευτέρου Αὐτοκράτορος Καίσαρος"
+
+
+def test_default_candidates():
+    detector = LanguageDetector()
+    assert set(detector.candidates) == {"GREEK", "LATIN", "ARABIC"}
+
+
+def test_detector_is_built_lazily():
+    detector = LanguageDetector()
+    assert detector._detector is None
+    assert detector.detect(LATIN) == "la"
+    assert detector._detector is not None
+
+
+def test_detect_many_memoizes():
+    detector = LanguageDetector()
+    assert detector.detect_many([LATIN, GREEK, LATIN]) == ["la", "grc", "la"]
+    assert detector.misses == 2
+    assert detector.detect(GREEK) == "grc"
+    assert detector.hits == 1
+    assert detector.misses == 2
+
+
+def test_memo_is_bounded():
+    detector = LanguageDetector(memo_size=1)
+    assert detector.detect_many([LATIN, GREEK]) == ["la", "grc"]
+    assert len(detector.memo) == 1
+
+
+def test_languages_only_guesses_untagged():
+    doc = ET.fromstring(
+        f'<div><ab xml:lang="cop">{LATIN}</ab><ab>{LATIN}</ab><ab>{GREEK}</ab></div>'
+    )
+    detector = LanguageDetector()
+    assert languages(list(doc), detector) == ["cop", "la", "grc"]
+    assert detector.misses == 2
+
+
+def test_unknown_languages():
+    assert unknown_languages(["greek", "Latin", "latn", "coptic"]) == [
+        "latn",
+        "coptic",
+    ]
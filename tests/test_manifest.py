@@ -0,0 +1,103 @@
+import json
+import os
+import shutil
+
+import pytest
+
+from maat.manifest import Manifest, file_digest, update_output
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+
+
+def fake_convert_batches(file_paths):
+    """
+    One record per file, whose id is the file name and whose text is its size
+    """
+    for path in file_paths:
+        name = os.path.basename(path)
+        yield path, [{"id": name, "size": os.path.getsize(path)}]
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    corpus = tmp_path / "corpus"
+    corpus.mkdir()
+    for name in os.listdir(DATA_DIR):
+        shutil.copy(os.path.join(DATA_DIR, name), corpus / name)
+    return corpus
+
+
+def run(corpus, tmp_path):
+    emitted = []
+    paths = sorted(str(p) for p in corpus.iterdir())
+    counts = update_output(
+        paths,
+        Manifest(str(tmp_path / "manifest.json")),
+        str(tmp_path / "out.jsonl"),
+        fake_convert_batches,
+        emit=emitted.append,
+    )
+    with open(tmp_path / "out.jsonl") as file:
+        output = {json.loads(line)["id"]: json.loads(line) for line in file}
+    return counts, emitted, output
+
+
+def test_first_run_converts_everything(corpus, tmp_path):
+    counts, emitted, output = run(corpus, tmp_path)
+    assert counts == {"unchanged": 0, "converted": 3, "deleted": 0}
+    assert len(emitted) == 3
+    assert len(output) == 3
+
+
+def test_unchanged_files_are_skipped(corpus, tmp_path):
+    run(corpus, tmp_path)
+    os.utime(corpus / "HD017877.xml")  # touched, not changed
+    counts, emitted, output = run(corpus, tmp_path)
+    assert counts == {"unchanged": 3, "converted": 0, "deleted": 0}
+    assert emitted == []
+    assert len(output) == 3
+
+
+def test_changed_new_and_deleted_files(corpus, tmp_path):
+    run(corpus, tmp_path)
+    with open(corpus / "HD017877.xml", "a") as file:
+        file.write("\n")
+    shutil.copy(corpus / "HD056774.xml", corpus / "new.xml")
+    os.remove(corpus / "aegyptus.89.240.xml")
+    counts, emitted, output = run(corpus, tmp_path)
+    assert counts == {"unchanged": 1, "converted": 2, "deleted": 1}
+    assert sorted(json.loads(line)["id"] for line in emitted) == [
+        "HD017877.xml",
+        "new.xml",
+    ]
+    assert sorted(output) == ["HD017877.xml", "HD056774.xml", "new.xml"]
+    assert output["HD017877.xml"]["size"] == os.path.getsize(corpus / "HD017877.xml")
+
+
+def test_new_converter_version_converts_everything(corpus, tmp_path):
+    run(corpus, tmp_path)
+    manifest = Manifest(str(tmp_path / "manifest.json"), version="next")
+    assert not any(manifest.is_current(path) for path in manifest.paths())
+
+
+def test_manifest_entry(corpus, tmp_path):
+    run(corpus, tmp_path)
+    manifest = Manifest(str(tmp_path / "manifest.json"))
+    path = str(corpus / "HD056774.xml")
+    assert manifest.entries[path]["sha256"] == file_digest(path)
+    assert manifest.ids(path) == ["HD056774.xml"]
+
+
+def test_files_outside_the_scan_are_not_deleted(corpus, tmp_path):
+    run(corpus, tmp_path)
+    path = str(corpus / "HD017877.xml")
+    counts = update_output(
+        [path],
+        Manifest(str(tmp_path / "manifest.json")),
+        str(tmp_path / "out.jsonl"),
+        fake_convert_batches,
+        scanned=lambda scanned_path: scanned_path == path,
+    )
+    assert counts == {"unchanged": 1, "converted": 0, "deleted": 0}
+    with open(tmp_path / "out.jsonl") as file:
+        assert len(file.readlines()) == 3
@@ -0,0 +1,173 @@
+import json
+import logging
+import os
+import queue
+
+import pytest
+
+from maat.errors import ErrorReport
+from maat.language import build_detector
+from maat.stats import CorpusStats
+from maat.pipeline import (
+    _init_worker,
+    Pipeline,
+    convert_files,
+    full_test_cases,
+    to_json,
+    xml_files,
+)
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+
+
+@pytest.fixture(scope="module")
+def data_files():
+    return list(xml_files(DATA_DIR))
+
+
+@pytest.fixture(scope="module")
+def serial_lines(data_files):
+    pipeline = Pipeline(build_detector())
+    return [to_json(r) for path in data_files for r in pipeline.process(path)]
+
+
+def test_xml_files(data_files):
+    assert len(data_files) == 3
+    assert all(path.endswith(".xml") for path in data_files)
+
+
+def test_process_records(serial_lines):
+    assert len(serial_lines) == 3
+    assert '"id": "unknown/aegyptus.89.240/1"' in serial_lines[0]
+
+
+def test_parallel_ordered_is_identical(data_files, serial_lines):
+    records = convert_files(
+        data_files, workers=2, chunksize=1, detector_factory=build_detector
+    )
+    assert [to_json(r) for r in records] == serial_lines
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_prefetched_is_identical(data_files, serial_lines, workers):
+    records = convert_files(
+        data_files,
+        workers=workers,
+        chunksize=2,
+        prefetch=2,
+        prefetch_buffer=1,
+        detector_factory=build_detector,
+    )
+    assert [to_json(r) for r in records] == serial_lines
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_staged_is_identical(data_files, serial_lines, workers):
+    records = convert_files(
+        data_files,
+        workers=workers,
+        staged=True,
+        queue_size=1,
+        detector_factory=build_detector,
+    )
+    assert [to_json(r) for r in records] == serial_lines
+
+
+def test_stats_merge_across_workers(data_files):
+    summaries = []
+    for workers in [1, 2]:
+        stats = CorpusStats()
+        records = list(
+            convert_files(
+                data_files,
+                workers=workers,
+                chunksize=1,
+                detector_factory=build_detector,
+                stats=stats,
+            )
+        )
+        summaries.append(stats.summary())
+    assert summaries[0] == summaries[1]
+    assert summaries[0]["block_lengths"]["count"] == len(records)
+    assert summaries[0]["tags"]["ab"] == len(records)
+
+
+def test_parallel_unordered_has_same_records(data_files, serial_lines):
+    records = convert_files(
+        data_files,
+        workers=2,
+        chunksize=1,
+        ordered=False,
+        detector_factory=build_detector,
+    )
+    assert sorted(to_json(r) for r in records) == sorted(serial_lines)
+
+
+def test_streaming_is_identical(data_files, serial_lines):
+    pipeline = Pipeline(build_detector(), streaming=True)
+    lines = [to_json(r) for path in data_files for r in pipeline.process(path)]
+    assert lines == serial_lines
+
+
+def test_span_test_cases_rebuild_full_ones(data_files, serial_lines):
+    pipeline = Pipeline(build_detector(), test_cases="spans")
+    records = [r for path in data_files for r in pipeline.process(path)]
+    for record, line in zip(records, serial_lines, strict=True):
+        full = json.loads(line)
+        assert "test_cases" not in record
+        assert full_test_cases(record) == full_test_cases(full) == full["test_cases"]
+
+
+def test_unknown_test_case_mode():
+    with pytest.raises(ValueError):
+        Pipeline(build_detector(), test_cases="some")
+
+
+BODY_TITLE_DOC = """<TEI xmlns="http://www.tei-c.org/ns/1.0">
+<teiHeader><fileDesc><publicationStmt>
+<idno type="filename">p.test.1</idno>
+</publicationStmt></fileDesc></teiHeader>
+<text><body>
+<head><title>BodyTitle</title><material>stone</material></head>
+<div type="edition" xml:lang="grc"><ab>ἔτους δευτέρου Αὐτοκράτορος</ab></div>
+</body></text>
+</TEI>
+"""
+
+
+def test_parsed_and_streamed_metadata_agree(tmp_path):
+    path = tmp_path / "doc.xml"
+    path.write_text(BODY_TITLE_DOC, encoding="utf-8")
+    records = [
+        list(Pipeline(build_detector(), streaming=streaming).process(str(path)))
+        for streaming in [False, True]
+    ]
+    assert records[0] == records[1]
+    # fields outside the teiHeader are not header fields
+    assert records[0][0]["title"] == "unknown"
+    assert records[0][0]["material"] == "unknown"
+
+
+def test_unrecoverable_file_is_skipped(tmp_path, data_files, serial_lines):
+    garbage = tmp_path / "garbage.xml"
+    garbage.write_bytes(b"not xml at all")
+    error_report = ErrorReport()
+    records = convert_files(
+        [str(garbage)] + data_files,
+        detector_factory=build_detector,
+        error_report=error_report,
+    )
+    assert [to_json(r) for r in records] == serial_lines
+    assert error_report.summary()["errors"]["XMLSyntaxError:"]["count"] == 1
+
+
+def test_worker_logs_to_the_run_queue():
+    root = logging.getLogger()
+    handlers = root.handlers
+    log_queue = queue.Queue()
+    try:
+        _init_worker(build_detector, {}, log_queue)
+        logging.warning("from a worker")
+    finally:
+        root.handlers = handlers
+    assert log_queue.get_nowait().getMessage() == "from a worker"
@@ -0,0 +1,59 @@
+import os
+
+from maat.language import build_detector
+from maat.pipeline import Pipeline, convert_files, xml_files
+from maat.profile import Profile
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+
+
+def test_profiled_pipeline():
+    paths = list(xml_files(DATA_DIR))
+    profile = Profile(slowest=2)
+    pipeline = Pipeline(build_detector(), profile=profile)
+    records = [r for path in paths for r in pipeline.process_all(path)]
+    assert records == [r for path in paths for r in Pipeline().process(path)]
+
+    summary = profile.summary()
+    for stage in ["parse", "header", "filter", "language", "convert"]:
+        assert summary["stages"][stage]["calls"] > 0
+    supplied = summary["handlers"]["supplied_text"]
+    assert supplied["calls"] == summary["tags"]["supplied"]
+    assert 0 <= supplied["self_wall"] <= supplied["wall"]
+    assert summary["handlers"]["ab_text"]["calls"] == len(records)
+    slowest = summary["slowest_files"]
+    assert len(slowest) == 2
+    assert slowest[0]["wall"] >= slowest[1]["wall"]
+
+
+def test_merge():
+    profile = Profile()
+    with profile.stage("parse"):
+        pass
+    profile.tags["gap"] += 2
+    profile.file("a.xml", 1.0)
+    summary = profile.take()
+    assert profile.summary()["stages"] == {}
+    profile.merge(summary)
+    profile.merge(summary)
+    merged = profile.summary()
+    assert merged["stages"]["parse"]["calls"] == 2
+    assert merged["tags"] == {"gap": 4}
+    assert len(merged["slowest_files"]) == 2
+
+
+def test_worker_profiles_are_merged():
+    paths = list(xml_files(DATA_DIR))
+    profile = Profile()
+    records = list(
+        convert_files(
+            paths,
+            workers=2,
+            chunksize=1,
+            detector_factory=build_detector,
+            profile=profile,
+        )
+    )
+    summary = profile.summary()
+    assert summary["stages"]["parse"]["calls"] == len(paths)
+    assert summary["handlers"]["ab_text"]["calls"] == len(records)
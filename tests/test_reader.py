@@ -0,0 +1,75 @@
+import json
+
+import pytest
+
+from maat.reader import RecordReader, build_index, index_path_for
+from maat.sinks import JSONLSink
+
+
+def make_records():
+    records = []
+    for corpus_id, language in [("DDbDP", "grc"), ("DCLP", "la")]:
+        for f in range(3):
+            for b in range(1, 3):
+                id = f"{corpus_id}/p.{f}/{b}"
+                records.append(
+                    {
+                        "corpus_id": corpus_id,
+                        "file_id": f"p.{f}",
+                        "block_index": b,
+                        "id": id,
+                        "language": language,
+                        "training_text": f"ἄνδρα {id}",
+                        "test_cases": [
+                            {"case_index": 1, "id": f"{id}/1", "test_case": "[...]"}
+                        ],
+                    }
+                )
+    return records
+
+
+def test_index_written_with_the_output(tmp_path):
+    records = make_records()
+    path = str(tmp_path / "maat.jsonl")
+    with JSONLSink(path, batch_size=5, index=index_path_for(path)) as sink:
+        sink.write_many(records)
+    with RecordReader(path) as reader:
+        assert len(reader) == len(records)
+        assert reader["DCLP/p.2/1"] == records[10]
+        assert reader.get("DDbDP/p.1/2/1") == records[3]["test_cases"][0]
+        assert "DDbDP/p.1/3" not in reader
+        assert reader.get("DDbDP/p.1/2/2") is None
+        with pytest.raises(KeyError):
+            reader["nothing"]
+        assert list(reader.records(corpus_id="DCLP")) == records[6:]
+        assert list(reader.records(language="grc", prefix="DDbDP/p.1/")) == (
+            records[2:4]
+        )
+        sample = reader.sample(4, seed=1, corpus_id="DDbDP")
+        assert len(sample) == 4
+        assert all(record in records[:6] for record in sample)
+        assert reader.sample(4, seed=1, corpus_id="DDbDP") == sample
+        assert len(reader.sample(100)) == len(records)
+
+
+def test_index_built_afterwards(tmp_path):
+    records = make_records()
+    path = tmp_path / "maat.jsonl"
+    path.write_text(
+        "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records),
+        encoding="utf-8",
+    )
+    assert build_index(str(path)) == len(records)
+    with RecordReader(str(path)) as reader:
+        assert [reader[record["id"]] for record in records] == records
+    # appending to the file makes the index stale
+    with open(path, "a", encoding="utf-8") as file:
+        file.write(json.dumps(records[0]) + "\n")
+    with pytest.raises(ValueError):
+        RecordReader(str(path))
+
+
+def test_compressed_output_cannot_be_indexed(tmp_path):
+    path = str(tmp_path / "maat.jsonl.gz")
+    with pytest.raises(ValueError):
+        JSONLSink(path, compression="gzip", index=index_path_for(path))
@@ -0,0 +1,90 @@
+import json
+import os
+
+import pytest
+
+from maat.shards import (
+    merge_shards,
+    parse_shard,
+    parse_shard_path,
+    shard_files,
+    shard_key,
+    shard_of,
+)
+
+
+def test_shard_key_is_relative_to_the_root(tmp_path):
+    root = tmp_path / "DDB_EpiDoc_XML"
+    path = root / "p.oxy" / "p.oxy.1.xml"
+    assert shard_key(str(path), str(root)) == "DDB_EpiDoc_XML/p.oxy/p.oxy.1.xml"
+    assert shard_key(str(path), str(root) + "/") == "DDB_EpiDoc_XML/p.oxy/p.oxy.1.xml"
+
+
+def test_shards_partition_the_files(tmp_path):
+    paths = [str(tmp_path / f"{i}.xml") for i in range(200)]
+    shards = [list(shard_files(paths, str(tmp_path), i, 4)) for i in range(1, 5)]
+    assert sorted(sum(shards, [])) == sorted(paths)
+    assert all(shards)
+    # stable: the same key always lands in the same shard
+    assert shard_of("root/a.xml", 4) == shard_of("root/a.xml", 4)
+
+
+def test_parse_shard():
+    assert parse_shard("1/1") == (1, 1)
+    for text in ["0/2", "3/2", "a/b"]:
+        with pytest.raises(ValueError):
+            parse_shard(text)
+
+
+def write_lines(path, ids):
+    with open(path, "w", encoding="utf-8") as file:
+        for id in ids:
+            file.write(json.dumps({"id": id, "text": id[::-1]}) + "\n")
+    return str(path)
+
+
+def test_merge_shards(tmp_path):
+    ids = [f"ddbdp/p.{f}/{b}" for f in range(30) for b in range(1, 4)]
+    first = write_lines(tmp_path / "1.jsonl", ids[::2])
+    second = write_lines(tmp_path / "2.jsonl", ids[1::2])
+    output = str(tmp_path / "merged.jsonl")
+    summary = merge_shards([first, second], output, run_size=7)
+    assert summary["ok"]
+    assert summary["records"] == len(ids)
+    with open(output, encoding="utf-8") as file:
+        merged = [json.loads(line) for line in file]
+    assert [record["id"] for record in merged] == sorted(ids)
+    assert merged[0]["text"] == merged[0]["id"][::-1]
+    assert sorted(os.listdir(tmp_path)) == ["1.jsonl", "2.jsonl", "merged.jsonl"]
+
+
+def test_merge_finds_duplicate_ids(tmp_path):
+    first = write_lines(tmp_path / "1.jsonl", ["c/a/1", "c/a/2", "c/b/1"])
+    second = write_lines(tmp_path / "2.jsonl", ["c/a/2", "c/b/3"])
+    summary = merge_shards(
+        [first, second], str(tmp_path / "merged.jsonl"), shards=[(1, 2), (2, 2)]
+    )
+    assert not summary["ok"]
+    assert summary["duplicate_examples"] == ["c/a/2"]
+    # c/b/2 failed to convert; its index is skipped, which is not a problem
+    assert not summary["missing_shards"]
+
+
+def test_merge_finds_missing_shards(tmp_path):
+    first = write_lines(tmp_path / "1.jsonl", ["c/a/2", "c/b/1"])
+    second = write_lines(tmp_path / "3.jsonl", ["c/c/1"])
+    output = str(tmp_path / "merged.jsonl")
+    summary = merge_shards([first, second], output, shards=[(1, 3), (3, 3)])
+    assert not summary["ok"]
+    assert summary["missing_shards"] == [2]
+    summary = merge_shards([first, first], output, shards=[(1, 1), (1, 1)])
+    assert summary["repeated_shards"] == [1]
+    summary = merge_shards([first], output, shards=[(1, 1)])
+    assert summary["ok"]
+
+
+def test_parse_shard_path():
+    assert parse_shard_path("2/4=a=b.jsonl") == ((2, 4), "a=b.jsonl")
+    for text in ["a.jsonl", "2/4=", "5/4=a.jsonl"]:
+        with pytest.raises(ValueError):
+            parse_shard_path(text)
@@ -0,0 +1,159 @@
+import gzip
+import json
+import sqlite3
+
+import pytest
+
+from maat.create import create_test_cases, materialize_test_case
+from maat.sinks import (
+    JSONLSink,
+    byte_offsets,
+    load_numpy_shard,
+    open_sink,
+    to_json_bytes,
+)
+
+RECORDS = [
+    {
+        "corpus_id": "ddbdp",
+        "file_id": f"p.test.{i}",
+        "block_index": 1,
+        "id": f"ddbdp/p.test.{i}/1",
+        "title": "A title",
+        "material": "papyrus",
+        "language": "grc" if i % 2 else "la",
+        "training_text": "αβ[γ]δ",
+        "test_cases": [
+            {"case_index": 1, "id": f"ddbdp/p.test.{i}/1/1", "test_case": "αβ[.]δ"}
+        ],
+    }
+    for i in range(5)
+]
+
+
+def test_to_json_bytes_is_json_dumps():
+    record = {"a": "β", "b": [1, 2]}
+    assert to_json_bytes(record) == json.dumps(record, ensure_ascii=False).encode()
+    assert to_json_bytes(record, compact=True) == '{"a":"β","b":[1,2]}'.encode()
+
+
+def test_to_json_bytes_without_orjson(monkeypatch):
+    record = dict(RECORDS[0], training_text='a\n\x01\u2028\\"b')
+    encoded = to_json_bytes(record, compact=True)
+    monkeypatch.setattr("maat.sinks.orjson", None)
+    assert to_json_bytes(record, compact=True) == encoded
+
+
+@pytest.mark.parametrize("output_format", ["jsonl", "jsonl.gz"])
+def test_jsonl_sinks(tmp_path, output_format):
+    path = tmp_path / f"out.{output_format}"
+    with open_sink(output_format, str(path), batch_size=2) as sink:
+        sink.write_many(RECORDS)
+    opener = gzip.open if output_format.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as file:
+        assert [json.loads(line) for line in file] == RECORDS
+    assert sink.count == len(RECORDS)
+
+
+def test_jsonl_sink_batches(tmp_path):
+    path = tmp_path / "out.jsonl"
+    sink = JSONLSink(str(path), batch_size=3)
+    sink.write_many(RECORDS[:4])
+    sink.file.flush()
+    assert len(path.read_bytes().splitlines()) == 3
+    sink.close()
+    assert len(path.read_bytes().splitlines()) == 4
+
+
+def test_zstd_sink(tmp_path):
+    zstandard = pytest.importorskip("zstandard")
+    path = tmp_path / "out.jsonl.zst"
+    with open_sink("jsonl.zst", str(path)) as sink:
+        sink.write_many(RECORDS)
+    with open(path, "rb") as file:
+        data = zstandard.ZstdDecompressor().stream_reader(file).read()
+    assert [json.loads(line) for line in data.splitlines()] == RECORDS
+
+
+def test_sqlite_sink(tmp_path):
+    path = str(tmp_path / "out.sqlite")
+    for _ in range(2):
+        with open_sink("sqlite", path, batch_size=2) as sink:
+            sink.write_many(RECORDS)
+    connection = sqlite3.connect(path)
+    rows = connection.execute(
+        "SELECT id, test_cases FROM records WHERE language = 'grc' ORDER BY id"
+    ).fetchall()
+    assert [row[0] for row in rows] == ["ddbdp/p.test.1/1", "ddbdp/p.test.3/1"]
+    assert json.loads(rows[0][1]) == RECORDS[1]["test_cases"]
+
+
+def test_parquet_sink(tmp_path):
+    parquet = pytest.importorskip("pyarrow.parquet")
+    path = str(tmp_path / "out.parquet")
+    with open_sink("parquet", path, batch_size=2) as sink:
+        sink.write_many(RECORDS)
+    rows = parquet.read_table(path).to_pylist()
+    assert [row["id"] for row in rows] == [record["id"] for record in RECORDS]
+    assert rows[0]["test_cases"] == RECORDS[0]["test_cases"]
+    assert rows[0]["test_case_spans"] is None
+
+
+@pytest.mark.parametrize("unit", ["codepoint", "byte"])
+def test_numpy_sink(tmp_path, unit):
+    pytest.importorskip("numpy")
+    path = str(tmp_path / "out")
+    records = RECORDS + [dict(RECORDS[0], id="x", training_text="a[b[c]d] e[f]")]
+    with open_sink("npy", path, unit=unit, shard_size=4, batch_size=3) as sink:
+        sink.write_many(records)
+    with open(tmp_path / "out" / "index.json") as file:
+        index = json.load(file)
+    assert [shard["blocks"] for shard in index["shards"]] == [4, 2]
+    shard = load_numpy_shard(str(tmp_path / "out" / "shard-00001"))
+    with open(tmp_path / "out" / "shard-00001" / "blocks.jsonl") as file:
+        assert [json.loads(line)["id"] for line in file] == ["ddbdp/p.test.4/1", "x"]
+    text = shard["text"]
+    if unit == "byte":
+        assert text.dtype.itemsize == 1
+        full_text = bytes(text).decode("utf-8")
+    else:
+        full_text = "".join(map(chr, text))
+    offsets, cases, case_offsets = (
+        shard["offsets"],
+        shard["cases"],
+        shard["case_offsets"],
+    )
+    for block, record in enumerate(records[4:]):
+        block_text = text[offsets[block] : offsets[block + 1]]
+        if unit == "byte":
+            block_text = bytes(block_text).decode("utf-8")
+        else:
+            block_text = "".join(map(chr, block_text))
+        expected = list(create_test_cases(record["training_text"]))
+        made = []
+        for row in cases[case_offsets[block] : case_offsets[block + 1]]:
+            assert row[0] == block
+            start = row[1] - offsets[block]
+            end = row[2] - offsets[block]
+            if unit == "byte":
+                prefix = bytes(text[offsets[block] : row[1]]).decode("utf-8")
+                middle = bytes(text[row[1] : row[2]]).decode("utf-8")
+                start, end = len(prefix), len(prefix) + len(middle)
+            made.append(materialize_test_case(block_text, [start, end, row[3]]))
+        assert made == expected
+    assert full_text.endswith("abcd ef")
+
+
+def test_binary_formats_need_a_path():
+    with pytest.raises(ValueError):
+        open_sink("sqlite")
+
+
+def test_byte_offsets():
+    text = "ἄνδρα μοι ἔννεπε"
+    spans = [(0, 2), (2, 5), (10, 16)]
+    expected = [
+        (len(text[:start].encode("utf-8")), len(text[:end].encode("utf-8")))
+        for start, end in spans
+    ]
+    assert byte_offsets(text, spans) == expected
@@ -0,0 +1,91 @@
+import random
+import threading
+import time
+
+import pytest
+
+from maat.stages import Stage, StagedRun
+
+
+def jittery(func):
+    rng = random.Random(0)
+    lock = threading.Lock()
+
+    def jittered(item):
+        with lock:
+            delay = rng.random() / 1000
+        time.sleep(delay)
+        return func(item)
+
+    return jittered
+
+
+def test_ordered_results():
+    run = StagedRun(
+        [
+            Stage("double", jittery(lambda x: 2 * x), workers=3, queue_size=2),
+            Stage("add", jittery(lambda x: x + 1), workers=2, queue_size=1),
+        ]
+    )
+    assert list(run.run(range(100))) == [2 * x + 1 for x in range(100)]
+    report = run.report()
+    assert report["double"]["items"] == report["add"]["items"] == 100
+    assert report["add"]["queue_max"] <= 1
+    assert set(report) == {"double", "add", "output"}
+
+
+def test_unordered_results():
+    run = StagedRun([Stage("s", jittery(str), workers=4)], ordered=False)
+    assert sorted(run.run(range(50)), key=int) == [str(x) for x in range(50)]
+
+
+def test_backpressure():
+    in_flight = []
+    lock = threading.Lock()
+    count = [0]
+
+    def started(x):
+        with lock:
+            count[0] += 1
+            in_flight.append(count[0])
+        return x
+
+    run = StagedRun([Stage("s", started, queue_size=2)], window=5)
+    for x in run.run(range(50)):
+        time.sleep(0.001)
+        with lock:
+            count[0] -= 1
+    assert max(in_flight) <= 5
+
+
+def test_stage_errors_are_raised_in_order():
+    def fail_on_5(x):
+        if x == 5:
+            raise ValueError("5")
+        return x
+
+    results = []
+    with pytest.raises(ValueError):
+        for x in StagedRun([Stage("s", jittery(fail_on_5), workers=3)]).run(range(10)):
+            results.append(x)
+    assert results == [0, 1, 2, 3, 4]
+
+
+def test_input_errors_are_raised_last():
+    def items():
+        yield from range(3)
+        raise OSError("listing failed")
+
+    results = []
+    with pytest.raises(OSError):
+        for x in StagedRun([Stage("s", jittery(lambda x: x), workers=2)]).run(items()):
+            results.append(x)
+    assert results == [0, 1, 2]
+
+
+def test_abandoned_run_stops():
+    run = StagedRun([Stage("s", lambda x: x, queue_size=1)])
+    results = run.run(iter(range(10**9)))
+    assert next(results) == 0
+    results.close()
+    assert threading.active_count() < 5
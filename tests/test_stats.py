@@ -0,0 +1,66 @@
+import random
+
+from maat.stats import CorpusStats, Distribution
+
+
+def test_distribution_small_integers_are_exact():
+    distribution = Distribution()
+    for value in [0, 1, 2, 2, 3, 3, 3, 7, 40]:
+        distribution.add(value)
+    summary = distribution.summary()
+    assert summary["count"] == 9
+    assert summary["total"] == 61
+    assert (summary["min"], summary["max"]) == (0, 40)
+    assert summary["mode"] == 3
+    assert summary["p50"] == 3
+    assert distribution.quantile(0) == 0
+    assert distribution.quantile(1) == 40
+
+
+def test_distribution_quantiles_are_within_the_error():
+    rng = random.Random(0)
+    values = [rng.randrange(1, 1_000_000) for _ in range(10_000)]
+    distribution = Distribution()
+    for value in values:
+        distribution.add(value)
+    values.sort()
+    for q in [0.1, 0.5, 0.9, 0.99]:
+        exact = values[round(q * (len(values) - 1))]
+        assert abs(distribution.quantile(q) - exact) <= 0.02 * exact
+    assert len(distribution.bins) < 1500
+
+
+def test_distributions_merge():
+    whole = Distribution()
+    parts = [Distribution(), Distribution()]
+    for value in range(100):
+        whole.add(value)
+        parts[value % 2].add(value)
+    merged = Distribution()
+    merged.merge(parts[0].summary())
+    merged.merge(parts[1].summary())
+    merged.merge(Distribution().summary())
+    assert merged.summary() == whole.summary()
+
+
+def test_corpus_stats():
+    stats = CorpusStats()
+    stats.add({"corpus_id": "DDbDP", "language": "grc", "training_text": "a[bc]d[e]"})
+    stats.add({"corpus_id": "DCLP", "language": "grc", "training_text": "xyz"})
+    summary = stats.summary()
+    assert summary["block_lengths"]["total"] == 8
+    assert summary["cases_per_block"]["max"] == 2
+    assert summary["mask_lengths"]["total"] == 3
+    assert dict(summary["corpus_id"])["DDbDP"] == {
+        "blocks": 1,
+        "cases": 2,
+        "characters": 5,
+    }
+    assert dict(summary["language"])["grc"]["blocks"] == 2
+    assert dict(summary["material"]) == {
+        None: {"blocks": 2, "cases": 2, "characters": 8}
+    }
+    other = CorpusStats()
+    other.merge(stats.take())
+    assert other.summary() == summary
+    assert stats.summary()["block_lengths"]["count"] == 0